@@ -0,0 +1,98 @@
+"""Compare the old and new overhead of filling fetched documents with their defaults.
+
+The old defaults were copied through ujson, which is no longer a requirement. Without
+it the legacy column is measured with the json module, its header says which one.
+
+Run from the repository root: python -m benchmarks.document_defaults
+"""
+
+import datetime
+import timeit
+
+try:
+    import ujson
+except ImportError:
+    import json as ujson
+
+from benchmarks.hot_paths import import_bot
+
+
+def legacy_set_default_dict(current_dict, default_dict):
+    for default_key, default_value in default_dict.items():
+        if default_key not in current_dict.keys():
+            current_dict[default_key] = ujson.loads(ujson.dumps(default_value))
+
+        if isinstance(default_value, dict):
+            for default_key_2, default_value_2 in default_value.items():
+                if default_key_2 not in current_dict[default_key].keys():
+                    current_dict[default_key][default_key_2] = ujson.loads(
+                        ujson.dumps(default_value_2)
+                    )
+
+    return current_dict
+
+
+def legacy_fetch(document, mongo_class):
+    if document is not None:
+        return legacy_set_default_dict(document, mongo_class.DEFAULT_GUILD_MEMBER)
+    return ujson.loads(ujson.dumps(mongo_class.DEFAULT_GUILD_MEMBER))
+
+
+def new_fetch(document, mongo_class):
+    if document is not None:
+        return mongo_class.GUILD_MEMBER_DEFAULTS.fill(document)
+    return mongo_class.GUILD_MEMBER_DEFAULTS.new()
+
+
+# A complete document, a document written before some fields existed and no document.
+DOCUMENTS = {
+    "hit": lambda: {
+        "_id": "212844004889329664",
+        "verification_pending": False,
+        "verification_cooldown": datetime.datetime(2022, 11, 30, 12, 0),
+        "verification_join_code": "aB3dE6",
+        "verification_join_inviter": 596978185422372866,
+        "exp": 120,
+        "level": 3,
+    },
+    "partial": lambda: {"_id": "212844004889329664", "exp": 12},
+    "miss": lambda: None,
+}
+
+
+def main() -> None:
+    import_bot()
+
+    # It imports the bot.
+    from cogs.mongodb import MongoDB
+
+    number = 100000
+
+    cooldown = DOCUMENTS["hit"]()["verification_cooldown"]
+    assert new_fetch(DOCUMENTS["hit"](), MongoDB)["verification_cooldown"] == cooldown
+    assert new_fetch(None, MongoDB) == legacy_fetch(None, MongoDB)
+    assert new_fetch(None, MongoDB) is not new_fetch(None, MongoDB)
+
+    legacy_header = f"{ujson.__name__} (µs)"
+    print(f"{'document':<10}{legacy_header:>14}{'new (µs)':>14}{'speedup':>10}")
+    for name, make_document in DOCUMENTS.items():
+        results = []
+        for fetch in (legacy_fetch, new_fetch):
+            timer = timeit.Timer(
+                "fetch(make_document(), MongoDB)",
+                globals={
+                    "fetch": fetch,
+                    "make_document": make_document,
+                    "MongoDB": MongoDB,
+                },
+            )
+            results.append(min(timer.repeat(repeat=5, number=number)) / number * 1e6)
+
+        print(
+            f"{name:<10}{results[0]:>14.3f}{results[1]:>14.3f}"
+            f"{results[0] / results[1]:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""Stand-ins for the Discord objects the cogs use, answering after some latency.
+
+Only the attributes and methods the benchmarked code paths use are implemented.
+"""
+
+import asyncio
+import itertools
+from typing import Dict, List, Optional
+
+import discord
+
+_snowflakes = itertools.count(1 << 50)
+
+
+def next_snowflake() -> int:
+    return next(_snowflakes)
+
+
+class FakeAPI:
+    """Counts the calls made to the Discord API and waits for each of them."""
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.calls = 0
+
+    async def call(self) -> None:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+
+
+class FakeRole:
+    def __init__(self, role_id: int, guild_id: int):
+        self.id = role_id
+        self.guild_id = guild_id
+        self.name = str(role_id)
+
+    @property
+    def mention(self) -> str:
+        return f"<@&{self.id}>"
+
+    def is_default(self) -> bool:
+        return self.id == self.guild_id
+
+
+class FakeMessage:
+    def __init__(
+        self,
+        api: FakeAPI,
+        channel: "FakeChannel",
+        author: Optional["FakeMember"] = None,
+        content: Optional[str] = None,
+        embeds: Optional[List[discord.Embed]] = None,
+    ):
+        self.id = next_snowflake()
+        self.api = api
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embeds = embeds or []
+
+    async def edit(self, **kwargs) -> "FakeMessage":
+        await self.api.call()
+
+        if "embed" in kwargs:
+            self.embeds = [kwargs["embed"]] if kwargs["embed"] is not None else []
+        if "content" in kwargs:
+            self.content = kwargs["content"]
+
+        return self
+
+    async def delete(self) -> None:
+        await self.api.call()
+
+    async def add_reaction(self, emoji: str) -> None:
+        await self.api.call()
+
+
+class FakeChannel:
+    def __init__(
+        self,
+        api: FakeAPI,
+        guild: "FakeGuild",
+        channel_id: Optional[int] = None,
+        name: str = "channel",
+        category_id: Optional[int] = None,
+    ):
+        self.id = channel_id or next_snowflake()
+        self.api = api
+        self.guild = guild
+        self.name = name
+        self.category_id = category_id
+
+    @property
+    def mention(self) -> str:
+        return f"<#{self.id}>"
+
+    async def send(
+        self,
+        content: Optional[str] = None,
+        *,
+        embed: Optional[discord.Embed] = None,
+        embeds: Optional[List[discord.Embed]] = None,
+        **kwargs,
+    ) -> FakeMessage:
+        await self.api.call()
+
+        if embed is not None:
+            embeds = [embed]
+        return FakeMessage(
+            self.api, self, self.guild.me, content=content, embeds=embeds
+        )
+
+    async def edit(self, **kwargs) -> "FakeChannel":
+        await self.api.call()
+        return self
+
+    async def delete(self) -> None:
+        await self.api.call()
+        self.guild.channels.pop(self.id, None)
+
+
+class FakeMember:
+    def __init__(self, api: FakeAPI, guild: Optional["FakeGuild"], member_id: int):
+        self.id = member_id
+        self.api = api
+        self.guild = guild
+        self.name = f"member{member_id}"
+        self.discriminator = "0001"
+        self.bot = False
+        self.roles: List[FakeRole] = []
+        self.guild_permissions = discord.Permissions.none()
+        self.display_avatar = f"https://cdn.discordapp.com/embed/avatars/0.png"
+
+    def __str__(self) -> str:
+        return f"{self.name}#{self.discriminator}"
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    async def add_roles(self, *roles: FakeRole, **kwargs) -> None:
+        await self.api.call()
+        self.roles.extend(role for role in roles if role not in self.roles)
+
+    async def remove_roles(self, *roles: FakeRole, **kwargs) -> None:
+        await self.api.call()
+        self.roles = [role for role in self.roles if role not in roles]
+
+    async def edit(self, *, roles: Optional[List[FakeRole]] = None, **kwargs) -> None:
+        await self.api.call()
+        if roles is not None:
+            self.roles = list(roles)
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> None:
+        await self.api.call()
+
+
+class FakeGuild:
+    """A chunked guild, whose channels and roles are created when first looked up."""
+
+    def __init__(self, api: FakeAPI, guild_id: int, me_id: int):
+        self.id = guild_id
+        self.api = api
+        self.name = "Discord Bot Owners"
+        self.chunked = True
+        self.filesize_limit = 25 * 1024 * 1024
+
+        self.members: Dict[int, FakeMember] = {}
+        self.channels: Dict[int, FakeChannel] = {}
+        self.roles: Dict[int, FakeRole] = {}
+
+        self.default_role = self.get_role(guild_id)
+        self.me = self.add_member(me_id)
+
+    def __str__(self) -> str:
+        return self.name
+
+    @property
+    def member_count(self) -> int:
+        return len(self.members)
+
+    def add_member(self, member_id: int) -> FakeMember:
+        member = self.members[member_id] = FakeMember(self.api, self, member_id)
+        return member
+
+    def get_member(self, member_id: int) -> Optional[FakeMember]:
+        return self.members.get(member_id)
+
+    async def fetch_member(self, member_id: int) -> FakeMember:
+        await self.api.call()
+
+        member = self.members.get(member_id)
+        if member is None:
+            raise discord.NotFound(FakeHTTPResponse(404), "Unknown Member")
+        return member
+
+    def get_channel(self, channel_id: int) -> FakeChannel:
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = FakeChannel(
+                self.api, self, channel_id
+            )
+        return channel
+
+    def get_role(self, role_id: int) -> FakeRole:
+        role = self.roles.get(role_id)
+        if role is None:
+            role = self.roles[role_id] = FakeRole(role_id, self.id)
+        return role
+
+    async def create_text_channel(
+        self, name: str, *, category: Optional[FakeChannel] = None, **kwargs
+    ) -> FakeChannel:
+        await self.api.call()
+
+        channel = FakeChannel(
+            self.api,
+            self,
+            name=name,
+            category_id=category.id if category is not None else None,
+        )
+        self.channels[channel.id] = channel
+        return channel
+
+
+class FakeHTTPResponse:
+    def __init__(self, status: int):
+        self.status = status
+        self.reason = "Fake"
+
+
+class FakeInteractionResponse:
+    def __init__(self, api: FakeAPI):
+        self.api = api
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def _respond(self) -> None:
+        if self._done:
+            raise discord.InteractionResponded(None)
+
+        self._done = True
+        await self.api.call()
+
+    async def send_message(self, content: Optional[str] = None, **kwargs) -> None:
+        await self._respond()
+
+    async def send_modal(self, modal: discord.ui.Modal) -> None:
+        await self._respond()
+
+    async def edit_message(self, **kwargs) -> None:
+        await self._respond()
+
+    async def defer(self, **kwargs) -> None:
+        await self._respond()
+
+
+class FakeInteraction:
+    def __init__(
+        self,
+        client: discord.Client,
+        user: FakeMember,
+        channel: Optional[FakeChannel] = None,
+        message: Optional[FakeMessage] = None,
+    ):
+        self.id = next_snowflake()
+        self.client = client
+        self.user = user
+        self.guild = user.guild
+        self.channel = channel
+        self.message = message
+        self.response = FakeInteractionResponse(user.api)
+        self.created_at = discord.utils.utcnow()
+
+    async def edit_original_response(self, **kwargs) -> None:
+        await self.user.api.call()
@@ -0,0 +1,387 @@
+"""An in-memory stand-in for the Motor database used by the MongoDB cog.
+
+Only the queries, updates and expressions the cog uses are supported. Every operation
+waits for a configurable latency, to simulate the round trip to the database.
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from cogs.mongodb import MongoDB, copy_document
+
+_MISSING = object()
+
+
+def _get_path(document: dict, path: str) -> Any:
+    value = document
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return _MISSING
+        value = value[key]
+
+    return value
+
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    # Missing fields and None sort before any other value, like in MongoDB.
+    if value is _MISSING or value is None:
+        return 0, 0
+    if isinstance(value, str):
+        return 2, value
+    return 1, value
+
+
+def _matches_operator(value: Any, operator: str, argument: Any) -> bool:
+    if operator == "$exists":
+        return (value is not _MISSING) == argument
+    if operator == "$in":
+        return value in argument
+    if operator == "$ne":
+        return (None if value is _MISSING else value) != argument
+    if value is _MISSING or value is None:
+        return False
+
+    if operator == "$gt":
+        return value > argument
+    if operator == "$gte":
+        return value >= argument
+    if operator == "$lt":
+        return value < argument
+    if operator == "$lte":
+        return value <= argument
+
+    raise NotImplementedError(f"Unsupported query operator {operator}.")
+
+
+def matches(document: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(document, sub_query) for sub_query in condition):
+                return False
+            continue
+
+        value = _get_path(document, key)
+        if isinstance(condition, dict) and all(k.startswith("$") for k in condition):
+            if not all(
+                _matches_operator(value, operator, argument)
+                for operator, argument in condition.items()
+            ):
+                return False
+        elif (None if value is _MISSING else value) != condition:
+            return False
+
+    return True
+
+
+def evaluate(document: dict, expression: Any) -> Any:
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = _get_path(document, expression[1:])
+        return None if value is _MISSING else value
+
+    if isinstance(expression, list):
+        return [evaluate(document, item) for item in expression]
+
+    if not isinstance(expression, dict):
+        return expression
+
+    (operator, arguments), *_ = expression.items()
+    if operator == "$literal":
+        return arguments
+
+    arguments = evaluate(document, arguments)
+    if operator == "$ifNull":
+        return next((value for value in arguments if value is not None), None)
+    if operator == "$add":
+        return sum(arguments)
+    if operator == "$min":
+        return min(arguments)
+    if operator == "$gte":
+        return arguments[0] >= arguments[1]
+    if operator == "$cond":
+        return arguments[1] if arguments[0] else arguments[2]
+    if operator == "$arrayElemAt":
+        array, index = arguments
+        return array[index] if -len(array) <= index < len(array) else None
+
+    raise NotImplementedError(f"Unsupported expression operator {operator}.")
+
+
+class InsertOneResult:
+    def __init__(self, inserted_id: Any):
+        self.inserted_id = inserted_id
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids: List[Any]):
+        self.inserted_ids = inserted_ids
+
+
+class FakeCursor:
+    def __init__(self, collection: "FakeCollection", query: dict, projection: Any):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._limit = 0
+
+    def sort(self, key_or_list: Any, direction: int = 1) -> "FakeCursor":
+        if isinstance(key_or_list, str):
+            key_or_list = [(key_or_list, direction)]
+        self._sort = list(key_or_list)
+        return self
+
+    def limit(self, limit: int) -> "FakeCursor":
+        self._limit = limit
+        return self
+
+    async def _results(self) -> List[dict]:
+        await self._collection.database.wait()
+
+        documents = [
+            document
+            for document in self._collection.documents.values()
+            if matches(document, self._query)
+        ]
+        for key, direction in reversed(self._sort):
+            documents.sort(
+                key=lambda document: _sort_key(_get_path(document, key)),
+                reverse=direction < 0,
+            )
+        if self._limit:
+            documents = documents[: self._limit]
+
+        return [
+            self._collection.project(document, self._projection)
+            for document in documents
+        ]
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        results = await self._results()
+        return results if length is None else results[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in await self._results():
+            yield document
+
+
+class FakeCollection:
+    def __init__(self, database: "FakeDatabase", name: str):
+        self.database = database
+        self.name = name
+        self.documents: Dict[Any, dict] = {}
+        self.unique_indexes: List[List[str]] = []
+
+    @staticmethod
+    def project(document: dict, projection: Any) -> dict:
+        document = copy_document(document)
+        if not projection:
+            return document
+
+        fields = (
+            projection
+            if isinstance(projection, list)
+            else [key for key, include in projection.items() if include]
+        )
+        return {
+            key: value
+            for key, value in document.items()
+            if key == "_id" or key in fields
+        }
+
+    def _check_unique(self, document: dict, ignored_id: Any = _MISSING) -> None:
+        for fields in self.unique_indexes:
+            values = [_get_path(document, field) for field in fields]
+            for other in self.documents.values():
+                if other["_id"] == ignored_id:
+                    continue
+                if [_get_path(other, field) for field in fields] == values:
+                    raise DuplicateKeyError(f"Duplicate key for {fields}: {values}.")
+
+    def _insert(self, document: dict) -> Any:
+        document = copy_document(document)
+        document.setdefault("_id", ObjectId())
+        if document["_id"] in self.documents:
+            raise DuplicateKeyError(f"Duplicate _id {document['_id']}.")
+        self._check_unique(document)
+
+        self.documents[document["_id"]] = document
+        return document["_id"]
+
+    def _update(
+        self, query: dict, update: Any, upsert: bool, many: bool = False
+    ) -> int:
+        documents = [
+            document for document in self.documents.values() if matches(document, query)
+        ]
+        if not many:
+            documents = documents[:1]
+
+        if len(documents) == 0 and upsert:
+            document = {
+                key: value
+                for key, value in query.items()
+                if not key.startswith("$") and not isinstance(value, dict)
+            }
+            document.setdefault("_id", ObjectId())
+            documents = [document]
+            self.documents[document["_id"]] = document
+
+        for document in documents:
+            if isinstance(update, list):
+                for stage in update:
+                    (operator, fields), *_ = stage.items()
+                    if operator != "$set":
+                        raise NotImplementedError(f"Unsupported stage {operator}.")
+                    values = {
+                        key: evaluate(document, value) for key, value in fields.items()
+                    }
+                    document.update(values)
+            elif not MongoDB._apply_update(document, update):
+                raise NotImplementedError(f"Unsupported update {update}.")
+
+        return len(documents)
+
+    async def create_index(self, keys: Any, unique: bool = False, **kwargs) -> str:
+        await self.database.wait()
+
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        if unique:
+            self.unique_indexes.append([key for key, _ in keys])
+
+        return "_".join(f"{key}_{direction}" for key, direction in keys)
+
+    async def find_one(self, query: dict, projection: Any = None) -> Optional[dict]:
+        await self.database.wait()
+
+        for document in self.documents.values():
+            if matches(document, query):
+                return self.project(document, projection)
+
+        return None
+
+    def find(self, query: Optional[dict] = None, projection: Any = None) -> FakeCursor:
+        return FakeCursor(self, query or {}, projection)
+
+    async def count_documents(self, query: dict) -> int:
+        await self.database.wait()
+        return sum(
+            1 for document in self.documents.values() if matches(document, query)
+        )
+
+    async def insert_one(self, document: dict) -> InsertOneResult:
+        await self.database.wait()
+        return InsertOneResult(self._insert(document))
+
+    async def update_one(self, query: dict, update: Any, upsert: bool = False) -> None:
+        await self.database.wait()
+        self._update(query, update, upsert)
+
+    async def update_many(self, query: dict, update: Any, upsert: bool = False) -> None:
+        await self.database.wait()
+        self._update(query, update, upsert, many=True)
+
+    async def delete_one(self, query: dict) -> None:
+        await self.database.wait()
+
+        for document_id, document in self.documents.items():
+            if matches(document, query):
+                del self.documents[document_id]
+                return
+
+    async def delete_many(self, query: dict) -> None:
+        await self.database.wait()
+
+        for document_id, document in list(self.documents.items()):
+            if matches(document, query):
+                del self.documents[document_id]
+
+    async def insert_many(
+        self, documents: List[dict], ordered: bool = True
+    ) -> InsertManyResult:
+        await self.database.wait()
+
+        inserted_ids = []
+        errors = []
+        for index, document in enumerate(documents):
+            try:
+                inserted_ids.append(self._insert(document))
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+
+        if len(errors) > 0:
+            raise BulkWriteError(
+                {"writeErrors": errors, "nInserted": len(inserted_ids)}
+            )
+
+        return InsertManyResult(inserted_ids)
+
+    async def find_one_and_update(
+        self, query: dict, update: Any, projection: Any = None
+    ) -> Optional[dict]:
+        await self.database.wait()
+
+        for document in self.documents.values():
+            if matches(document, query):
+                before = self.project(document, projection)
+                self._update({"_id": document["_id"]}, update, upsert=False)
+                return before
+
+        return None
+
+    async def find_one_and_delete(self, query: dict) -> Optional[dict]:
+        await self.database.wait()
+
+        for document_id, document in self.documents.items():
+            if matches(document, query):
+                return self.documents.pop(document_id)
+
+        return None
+
+    async def bulk_write(self, requests: list, ordered: bool = True) -> None:
+        await self.database.wait()
+
+        errors = []
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                elif isinstance(request, UpdateOne):
+                    self._update(request._filter, request._doc, request._upsert)
+                else:
+                    raise NotImplementedError(f"Unsupported request {request}.")
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+
+        if len(errors) > 0:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+class FakeDatabase:
+    """A database whose collections live in memory, answering after some latency."""
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.operations = 0
+        self._collections: Dict[str, FakeCollection] = {}
+
+    async def wait(self) -> None:
+        self.operations += 1
+        await asyncio.sleep(self.latency)
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = FakeCollection(self, name)
+        return collection
@@ -0,0 +1,341 @@
+"""Measure the throughput and latency of the hot paths of the cogs, offline.
+
+The cogs are loaded in a bot which never connects to Discord, their database is an
+in-memory stand-in and they are driven with fake messages and interactions. Both the
+database and the Discord API answer after a configurable latency.
+
+Run from the repository root: python -m benchmarks.hot_paths --output results.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import discord
+
+from benchmarks.fake_discord import (
+    FakeAPI,
+    FakeChannel,
+    FakeGuild,
+    FakeInteraction,
+    FakeMember,
+    FakeMessage,
+)
+from metrics import percentile
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_bot():
+    """Import the bot with the example config, it is read from the working directory."""
+    with open(os.path.join(REPOSITORY_PATH, "config_example.json")) as fic:
+        config = json.load(fic)
+    config["metrics_port"] = None
+
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as config_directory:
+        with open(os.path.join(config_directory, "config.json"), "w") as fic:
+            json.dump(config, fic)
+
+        os.chdir(config_directory)
+        try:
+            import discord_bot_owners
+        finally:
+            os.chdir(working_directory)
+
+    return discord_bot_owners
+
+
+class Bench:
+    """The bot, its fake guild and database, shared by the scenarios."""
+
+    def __init__(self, client, database, api: FakeAPI, members: int):
+        self.client = client
+        self.database = database
+        self.api = api
+
+        config = client.config
+        self.guild = FakeGuild(api, config["guild_id"], next_member_id())
+        client._connection.user = self.guild.me
+
+        self.members = [self.guild.add_member(next_member_id()) for _ in range(members)]
+        self.text_channel = self.guild.get_channel(config["channel_id"]["general"])
+        self.tickets_category = self.guild.get_channel(config["category_id"]["tickets"])
+        self.verification_requests_channel = self.guild.get_channel(
+            config["channel_id"]["verification_requests"]
+        )
+
+        self.manager = self.members[0]
+        self.manager.roles.append(self.guild.get_role(config["role_id"]["manager"]))
+
+    def member(self, iteration: int) -> FakeMember:
+        return self.members[iteration % len(self.members)]
+
+    def seed_guild_members(self) -> None:
+        """Give some exp to every member, so the ranks are computed among them."""
+        collection = self.database["guild_member"]
+        for member in self.members:
+            collection._insert(
+                {
+                    "_id": str(member.id),
+                    "level": random.randint(1, 30),
+                    "exp": random.randint(0, 500),
+                }
+            )
+
+
+_member_ids = iter(range(10**17, 10**18))
+
+
+def next_member_id() -> int:
+    return next(_member_ids)
+
+
+""" Scenarios. """
+
+
+class Scenario:
+    def __init__(
+        self,
+        run: Callable[[Bench, int], Awaitable[None]],
+        prepare: Optional[Callable[[Bench, int], Awaitable[None]]] = None,
+    ):
+        self.run = run
+        self.prepare = prepare
+
+
+async def on_message(bench: Bench, iteration: int) -> None:
+    message = FakeMessage(
+        bench.api, bench.text_channel, bench.member(iteration), content="Hello!"
+    )
+    await bench.client.get_cog("General").on_message(message)
+
+
+async def level(bench: Bench, iteration: int) -> None:
+    general = bench.client.get_cog("General")
+    interaction = FakeInteraction(bench.client, bench.member(iteration))
+    await general.level.callback(general, interaction, None)
+
+
+async def create_ticket(bench: Bench, iteration: int) -> None:
+    from cogs.tickets import create_ticket
+
+    # A new member each time, a member can only have one ticket in a category.
+    member = bench.guild.add_member(next_member_id())
+    await create_ticket(FakeInteraction(bench.client, member), "Support")
+
+
+async def prepare_close(bench: Bench, iterations: int) -> None:
+    bench.ticket_channels = []
+    for _ in range(iterations):
+        channel = FakeChannel(
+            bench.api, bench.guild, category_id=bench.tickets_category.id
+        )
+        bench.guild.channels[channel.id] = channel
+        bench.database["tickets"]._insert(
+            {
+                "channel_id": channel.id,
+                "category": "Support",
+                "user_id": next_member_id(),
+            }
+        )
+        bench.ticket_channels.append(channel)
+
+
+async def close(bench: Bench, iteration: int) -> None:
+    tickets = bench.client.get_cog("Tickets")
+    interaction = FakeInteraction(
+        bench.client, bench.manager, channel=bench.ticket_channels[iteration]
+    )
+    await tickets.close.callback(tickets, interaction)
+
+
+async def prepare_accept_verification(bench: Bench, iterations: int) -> None:
+    bench.verification_messages = []
+    for _ in range(iterations):
+        member = bench.guild.add_member(next_member_id())
+
+        embed = discord.Embed(title="Library Developer Verification")
+        embed.add_field(name="User", value=member.mention)
+        embed.add_field(name="Library", value="discord.py")
+        embed.add_field(name="Link", value="https://github.com/Rapptz/discord.py")
+        embed.add_field(name="Status", value="Pending.")
+
+        message = FakeMessage(
+            bench.api,
+            bench.verification_requests_channel,
+            bench.guild.me,
+            embeds=[embed],
+        )
+        bench.database["pending_verifications"]._insert(
+            {"_id": str(message.id), "user_id": member.id}
+        )
+        bench.database["guild_member"]._insert(
+            {"_id": str(member.id), "verification_pending": True}
+        )
+        bench.verification_messages.append(message)
+
+
+async def accept_verification(bench: Bench, iteration: int) -> None:
+    from cogs.verification import PendingVerificationView
+
+    view = PendingVerificationView()
+    interaction = FakeInteraction(
+        bench.client, bench.manager, message=bench.verification_messages[iteration]
+    )
+    await view.accept.callback(interaction)
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "on_message": Scenario(on_message),
+    "level": Scenario(level),
+    "create_ticket": Scenario(create_ticket),
+    "close": Scenario(close, prepare_close),
+    "accept_verification": Scenario(accept_verification, prepare_accept_verification),
+}
+
+
+""" Runner. """
+
+
+async def measure(
+    bench: Bench, scenario: Scenario, iterations: int, concurrency: int
+) -> dict:
+    if scenario.prepare is not None:
+        await scenario.prepare(bench, iterations)
+
+    database_operations = bench.database.operations
+    api_calls = bench.api.calls
+
+    latencies = []
+    pending_iterations = iter(range(iterations))
+
+    async def worker() -> None:
+        for iteration in pending_iterations:
+            start = time.perf_counter()
+            await scenario.run(bench, iteration)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "elapsed_seconds": round(elapsed, 6),
+        "throughput_per_second": round(iterations / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "database_operations": bench.database.operations - database_operations,
+        "api_calls": bench.api.calls - api_calls,
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    discord_bot_owners = import_bot()
+
+    # Both import the bot, through the MongoDB cog.
+    from benchmarks.fake_mongo import FakeDatabase
+    from cogs.mongodb import MongoDB
+
+    random.seed(args.seed)
+
+    client = discord_bot_owners.DiscordBotOwners()
+    database = FakeDatabase(args.database_latency / 1000)
+    api = FakeAPI(args.api_latency / 1000)
+
+    results = {}
+    async with client:
+        mongo = MongoDB(client)
+        mongo.db = database
+        await client.add_cog(mongo)
+
+        for extension in (
+            "cogs.outbox",
+            "cogs.role_queue",
+            "cogs.general",
+            "cogs.tickets",
+            "cogs.verification",
+        ):
+            await client.load_extension(extension)
+
+        bench = Bench(client, database, api, args.members)
+        bench.seed_guild_members()
+
+        for name in args.scenarios:
+            results[name] = await measure(
+                bench, SCENARIOS[name], args.iterations, args.concurrency
+            )
+
+    return {
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "discord.py": discord.__version__,
+        "settings": {
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "database_latency_ms": args.database_latency,
+            "api_latency_ms": args.api_latency,
+            "members": args.members,
+            "seed": args.seed,
+        },
+        "scenarios": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--database-latency",
+        type=float,
+        default=1,
+        help="The latency of each database operation, in milliseconds.",
+    )
+    parser.add_argument(
+        "--api-latency",
+        type=float,
+        default=50,
+        help="The latency of each Discord API call, in milliseconds.",
+    )
+    parser.add_argument(
+        "--members",
+        type=int,
+        default=1000,
+        help="The number of members with exp in the database.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--scenario",
+        dest="scenarios",
+        action="append",
+        choices=list(SCENARIOS),
+        help="A scenario to run, can be repeated. Every scenario runs by default.",
+    )
+    parser.add_argument("--output", help="A file to write the results to.")
+    args = parser.parse_args()
+
+    if args.scenarios is None:
+        args.scenarios = list(SCENARIOS)
+
+    results = asyncio.run(run(args))
+
+    output = json.dumps(results, indent=2)
+    if args.output is not None:
+        with open(args.output, "w") as fic:
+            fic.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,57 @@
+import asyncio
+import logging
 import math
 import random
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
 
 from discord_bot_owners import DiscordBotOwners
+from metrics import timed_callback
+from pagination import PageCache, PaginatedView
+from throttle import Throttle, throttled_command
+
+log = logging.getLogger(__name__)
+
+LEVEL_THROTTLE = Throttle("level", rate=3, per=10, global_rate=20, global_per=1)
+
+
+MAX_LEVEL = 100
+
+# The exp needed to reach the next level, indexed by the current level.
+EXP_NEEDED = [0] + [
+    int(math.log(4 * level) ** 5 * 10) for level in range(1, MAX_LEVEL + 1)
+]
 
 
 def get_exp_needed(current_level: int) -> int:
-    return int(math.log(4 * current_level) ** 5 * 10)
+    return EXP_NEEDED[min(current_level, MAX_LEVEL)]
+
+
+def build_exp_update(exp_won: int) -> list:
+    """Build an update pipeline adding exp to a member and leveling them up if needed.
+
+    The level up is decided by the database so concurrent updates can't lose exp or
+    skip a level.
+    """
+    current_level = {"$ifNull": ["$level", 1]}
+    new_exp = {"$add": [{"$ifNull": ["$exp", 0]}, exp_won]}
+    exp_needed = {"$arrayElemAt": [EXP_NEEDED, {"$min": [current_level, MAX_LEVEL]}]}
+    level_up = {"$gte": [new_exp, exp_needed]}
+
+    return [
+        {
+            "$set": {
+                "level": {
+                    "$cond": [level_up, {"$add": [current_level, 1]}, current_level]
+                },
+                "exp": {"$cond": [level_up, exp_won, new_exp]},
+            }
+        }
+    ]
 
 
 class AutoRolesView(discord.ui.View):
@@ -22,6 +63,7 @@ class AutoRolesView(discord.ui.View):
         style=discord.ButtonStyle.blurple,
         custom_id="persisten:announcements",
     )
+    @timed_callback
     async def announcements(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ) -> None:
@@ -29,21 +71,29 @@ class AutoRolesView(discord.ui.View):
             interaction.client.config["role_id"]["announcements"]
         )
 
-        if announcements_role in interaction.user.roles:
-            await interaction.user.remove_roles(announcements_role)
+        role_queue = interaction.client.role_queue
+        if role_queue.has_role(interaction.user, announcements_role):
+            role_change = role_queue.edit_roles(
+                interaction.user, remove=[announcements_role]
+            )
             await interaction.response.send_message(
                 "You will no longer be pinged when an announcement is posted.",
                 ephemeral=True,
             )
         else:
-            await interaction.user.add_roles(announcements_role)
+            role_change = role_queue.edit_roles(
+                interaction.user, add=[announcements_role]
+            )
             await interaction.response.send_message(
                 "You will now be pinged when an announcement is posted.", ephemeral=True
             )
 
+        await role_change
+
     @discord.ui.button(
         label="Events", style=discord.ButtonStyle.blurple, custom_id="persisten:events"
     )
+    @timed_callback
     async def events(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ) -> None:
@@ -51,21 +101,25 @@ class AutoRolesView(discord.ui.View):
             interaction.client.config["role_id"]["events"]
         )
 
-        if events_role in interaction.user.roles:
-            await interaction.user.remove_roles(events_role)
+        role_queue = interaction.client.role_queue
+        if role_queue.has_role(interaction.user, events_role):
+            role_change = role_queue.edit_roles(interaction.user, remove=[events_role])
             await interaction.response.send_message(
                 "You will no longer be pinged when an event is starting.",
                 ephemeral=True,
             )
         else:
-            await interaction.user.add_roles(events_role)
+            role_change = role_queue.edit_roles(interaction.user, add=[events_role])
             await interaction.response.send_message(
                 "You will now be pinged when an event is starting.", ephemeral=True
             )
 
+        await role_change
+
     @discord.ui.button(
         label="Polls", style=discord.ButtonStyle.blurple, custom_id="persisten:polls"
     )
+    @timed_callback
     async def polls(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ) -> None:
@@ -73,17 +127,55 @@ class AutoRolesView(discord.ui.View):
             interaction.client.config["role_id"]["polls"]
         )
 
-        if polls_role in interaction.user.roles:
-            await interaction.user.remove_roles(polls_role)
+        role_queue = interaction.client.role_queue
+        if role_queue.has_role(interaction.user, polls_role):
+            role_change = role_queue.edit_roles(interaction.user, remove=[polls_role])
             await interaction.response.send_message(
                 "You will no longer be pinged when a poll is posted.", ephemeral=True
             )
         else:
-            await interaction.user.add_roles(polls_role)
+            role_change = role_queue.edit_roles(interaction.user, add=[polls_role])
             await interaction.response.send_message(
                 "You will now be pinged when a poll is posted.", ephemeral=True
             )
 
+        await role_change
+
+
+class LeaderboardView(PaginatedView):
+    def __init__(self, cog: "General", author_id: int, entries: List[dict]):
+        super().__init__(
+            author_id,
+            entries,
+            cog.LEADERBOARD_PAGE_SIZE,
+            cog.fetch_leaderboard_page,
+            lambda entry: (entry["level"], entry["exp"], entry["_id"]),
+        )
+        self.cog = cog
+
+    def build_embed(self) -> discord.Embed:
+        description = ""
+        for position, entry in enumerate(
+            self.entries, start=self.page * self.cog.LEADERBOARD_PAGE_SIZE + 1
+        ):
+            description += (
+                f"**{position}.** <@{entry['_id']}> - Level **{entry['level']}** "
+                f"(**{entry['exp']}**/**{get_exp_needed(entry['level'])}**)\n"
+            )
+
+        if len(description) == 0:
+            description = "Nobody has gained any exp yet."
+
+        leaderboard_embed = discord.Embed(
+            title="Leaderboard",
+            description=description,
+            color=self.cog.client.color,
+            timestamp=discord.utils.utcnow(),
+        )
+        leaderboard_embed.set_footer(text=f"Page {self.page + 1}")
+
+        return leaderboard_embed
+
 
 class SuggestModal(discord.ui.Modal, title="Suggestion"):
     suggestion = discord.ui.TextInput(
@@ -124,8 +216,19 @@ class General(commands.Cog):
     def __init__(self, client: DiscordBotOwners):
         self.client = client
 
+        self._pending_exp: Dict[int, int] = {}
+        self._exp_flush_lock = asyncio.Lock()
+        self._exp_flusher: Optional[asyncio.Task] = None
+
+        self._leaderboard_cache = PageCache(self.LEADERBOARD_CACHE_TTL)
+
     async def cog_load(self) -> None:
-        self.client.loop.create_task(self.after_ready())
+        self.client.add_ready_task("view rehydration general", self.after_ready)
+        self.flush_exp_loop.start()
+
+    async def cog_unload(self) -> None:
+        self.flush_exp_loop.stop()
+        await self.flush_exp()
 
     async def after_ready(self) -> None:
         await self.client.wait_until_ready()
@@ -161,22 +264,77 @@ class General(commands.Cog):
     EXP_CHOICES = [1, 2, 3]
     EXP_WEIGHTS = [0.70, 0.15, 0.15]
 
+    # The exp won is buffered in memory and written in a single bulk write, either
+    # periodically or once enough members are waiting to be written.
+    EXP_FLUSH_INTERVAL = 30
+    EXP_FLUSH_THRESHOLD = 500
+
     async def _update_exp(self, member: discord.Member, exp_won: int) -> None:
-        guild_member = await self.client.mongo.fetch_guild_member(member.id)
+        self._pending_exp[member.id] = self._pending_exp.get(member.id, 0) + exp_won
 
-        current_level = guild_member["level"]
-        current_exp = guild_member["exp"]
-        exp_needed = get_exp_needed(current_level)
+        if (
+            len(self._pending_exp) >= self.EXP_FLUSH_THRESHOLD
+            and not self._exp_flush_lock.locked()
+            and (self._exp_flusher is None or self._exp_flusher.done())
+        ):
+            self._exp_flusher = self.client.loop.create_task(self.flush_exp())
 
-        if exp_needed <= (current_exp + exp_won):
-            new_level = current_level + 1
-            await self.client.mongo.update_guild_member_document(
-                member.id, {"$set": {"exp": exp_won, "level": new_level}}
-            )
-        else:
-            await self.client.mongo.update_guild_member_document(
-                member.id, {"$inc": {"exp": exp_won}}
-            )
+    async def _write_exp(self, pending_exp: Dict[int, int]) -> None:
+        await self.client.mongo.update_guild_member_documents(
+            {
+                member_id: build_exp_update(exp_won)
+                for member_id, exp_won in pending_exp.items()
+            }
+        )
+
+    async def flush_exp(self) -> None:
+        async with self._exp_flush_lock:
+            if len(self._pending_exp) == 0:
+                return
+
+            pending_exp, self._pending_exp = self._pending_exp, {}
+
+            try:
+                await self._write_exp(pending_exp)
+            except BulkWriteError as e:
+                # The write is unordered, only the failed updates are written again.
+                member_ids = list(pending_exp.keys())
+                failed_member_ids = [
+                    member_ids[error["index"]] for error in e.details["writeErrors"]
+                ]
+                self._restore_exp(
+                    {
+                        member_id: pending_exp[member_id]
+                        for member_id in failed_member_ids
+                    }
+                )
+                log.exception(
+                    "Failed to write the exp of %d of %d members.",
+                    len(failed_member_ids),
+                    len(pending_exp),
+                )
+            except ServerSelectionTimeoutError:
+                # No server was reached, none of the updates were applied.
+                self._restore_exp(pending_exp)
+                log.exception(
+                    "Failed to write the exp of %d members.", len(pending_exp)
+                )
+            except Exception:
+                # Some of the updates may have been applied, writing them again
+                # would give their exp twice.
+                log.exception(
+                    "Failed to write the exp of %d members, it is dropped.",
+                    len(pending_exp),
+                )
+
+    def _restore_exp(self, pending_exp: Dict[int, int]) -> None:
+        """Put exp back so it is written with the next flush."""
+        for member_id, exp_won in pending_exp.items():
+            self._pending_exp[member_id] = self._pending_exp.get(member_id, 0) + exp_won
+
+    @tasks.loop(seconds=EXP_FLUSH_INTERVAL)
+    async def flush_exp_loop(self) -> None:
+        await self.flush_exp()
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -186,10 +344,14 @@ class General(commands.Cog):
         if message.author.id == self.client.user.id:
             return
 
-        exp_amount = random.choices(self.EXP_CHOICES, self.EXP_WEIGHTS)[0]
-        await self._update_exp(message.author, exp_amount)
+        with self.client.metrics.time(
+            "discord_listener_duration_seconds", listener="on_message"
+        ):
+            exp_amount = random.choices(self.EXP_CHOICES, self.EXP_WEIGHTS)[0]
+            await self._update_exp(message.author, exp_amount)
 
     @app_commands.command(name="level")
+    @throttled_command(LEVEL_THROTTLE)
     async def level(
         self, interaction: discord.Interaction, user: Optional[discord.User]
     ):
@@ -201,16 +363,42 @@ class General(commands.Cog):
         level = guild_member["level"]
         current_exp = guild_member["exp"]
         exp_needed = get_exp_needed(level)
+        rank = await self.client.mongo.fetch_guild_member_rank(level, current_exp)
 
         level_embed = discord.Embed(
             title=f"{user}",
-            description=f"{user.mention} is currently level **{level}** (**{current_exp}**/**{exp_needed}**).",
+            description=f"{user.mention} is currently level **{level}** (**{current_exp}**/**{exp_needed}**), "
+            f"ranked **#{rank}**.",
             color=self.client.color,
             timestamp=discord.utils.utcnow(),
         )
 
         await interaction.response.send_message(embed=level_embed)
 
+    # Only the first pages are cached, they are the ones viewed the most.
+    LEADERBOARD_PAGE_SIZE = 10
+    LEADERBOARD_CACHED_PAGES = 5
+    LEADERBOARD_CACHE_TTL = 60
+
+    async def fetch_leaderboard_page(
+        self, cursor: Optional[Tuple[int, int, str]], page: int
+    ) -> List[dict]:
+        return await self._leaderboard_cache.fetch(
+            cursor,
+            lambda: self.client.mongo.fetch_leaderboard(
+                cursor, self.LEADERBOARD_PAGE_SIZE
+            ),
+            cache=page < self.LEADERBOARD_CACHED_PAGES,
+        )
+
+    @app_commands.command(name="leaderboard")
+    async def leaderboard(self, interaction: discord.Interaction):
+        """Check the members with the highest levels."""
+        entries = await self.fetch_leaderboard_page(None, 0)
+        view = LeaderboardView(self, interaction.user.id, entries)
+
+        await interaction.response.send_message(embed=view.build_embed(), view=view)
+
     """ Suggestions system. """
 
     @app_commands.command(name="suggest")
@@ -0,0 +1,134 @@
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Deque, Dict, NamedTuple, Optional
+
+from discord.ext import commands
+
+from discord_bot_owners import DiscordBotOwners
+from metrics import percentile
+
+log = logging.getLogger(__name__)
+
+
+class SlowCallback(NamedTuple):
+    blocked_at: float
+    duration: float
+    task_name: Optional[str]
+    stack: Optional[str]
+
+
+class LoopMonitor(commands.Cog):
+    """The cog measuring how late the event loop runs what it is given."""
+
+    # The loop is asked to wake up every interval, how late it wakes up is its lag.
+    SAMPLE_INTERVAL = 0.1
+    LAG_SAMPLES = 3000
+
+    # A watchdog thread takes the stack of the loop's thread when it has been
+    # blocked for longer than the threshold, the stack shows what is blocking it.
+    SLOW_CALLBACK_THRESHOLD = 0.25
+    SLOW_CALLBACKS = 20
+
+    def __init__(self, client: DiscordBotOwners):
+        self.client = client
+
+        self.lag_samples: Deque[float] = collections.deque(maxlen=self.LAG_SAMPLES)
+        self.slow_callbacks: Deque[SlowCallback] = collections.deque(
+            maxlen=self.SLOW_CALLBACKS
+        )
+
+        self._last_wakeup = time.monotonic()
+        self._blocked_stack: Optional[str] = None
+        self._blocked_task_name: Optional[str] = None
+
+        self._sampler: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._watchdog_stopped = threading.Event()
+
+    async def cog_load(self) -> None:
+        self._last_wakeup = time.monotonic()
+        self._sampler = self.client.loop.create_task(self.sample_lag())
+
+        self._watchdog = threading.Thread(
+            target=self.watch_loop,
+            args=(threading.get_ident(),),
+            name="loop-monitor-watchdog",
+            daemon=True,
+        )
+        self._watchdog.start()
+
+    async def cog_unload(self) -> None:
+        self._watchdog_stopped.set()
+        if self._sampler is not None:
+            self._sampler.cancel()
+
+    async def sample_lag(self) -> None:
+        while True:
+            await asyncio.sleep(self.SAMPLE_INTERVAL)
+
+            now = time.monotonic()
+            lag = max(0.0, now - self._last_wakeup - self.SAMPLE_INTERVAL)
+            self._last_wakeup = now
+
+            self.lag_samples.append(lag)
+            self.client.metrics.observe("event_loop_lag_seconds", lag)
+
+            if lag >= self.SLOW_CALLBACK_THRESHOLD:
+                self._record_slow_callback(now - lag, lag)
+
+    def _record_slow_callback(self, blocked_at: float, duration: float) -> None:
+        stack, self._blocked_stack = self._blocked_stack, None
+        task_name, self._blocked_task_name = self._blocked_task_name, None
+
+        self.slow_callbacks.append(SlowCallback(blocked_at, duration, task_name, stack))
+        self.client.metrics.increment("event_loop_slow_callbacks_total")
+
+        log.warning(
+            "The event loop was blocked for %.3fs by %s.\n%s",
+            duration,
+            task_name or "a callback",
+            stack or "The stack wasn't captured.",
+        )
+
+    def watch_loop(self, loop_thread_id: int) -> None:
+        """Take the stack of the loop's thread while it is blocked, in another thread."""
+        reported_wakeup = None
+
+        while not self._watchdog_stopped.wait(self.SLOW_CALLBACK_THRESHOLD / 2):
+            last_wakeup = self._last_wakeup
+            if last_wakeup == reported_wakeup:
+                continue
+
+            blocked_for = time.monotonic() - last_wakeup - self.SAMPLE_INTERVAL
+            if blocked_for < self.SLOW_CALLBACK_THRESHOLD:
+                continue
+
+            frame = sys._current_frames().get(loop_thread_id)
+            if frame is None:
+                continue
+
+            task = asyncio.current_task(self.client.loop)
+            self._blocked_task_name = task.get_name() if task is not None else None
+            self._blocked_stack = "".join(traceback.format_stack(frame))
+            reported_wakeup = last_wakeup
+
+    def lag_percentiles(self) -> Optional[Dict[str, float]]:
+        if len(self.lag_samples) == 0:
+            return None
+
+        lag_samples = sorted(self.lag_samples)
+        return {
+            "p50": percentile(lag_samples, 50),
+            "p90": percentile(lag_samples, 90),
+            "p99": percentile(lag_samples, 99),
+            "max": lag_samples[-1],
+        }
+
+
+async def setup(client):
+    await client.add_cog(LoopMonitor(client))
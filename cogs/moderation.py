@@ -1,5 +1,6 @@
+import asyncio
 import datetime
-from typing import Union, Optional
+from typing import List, Optional, Tuple, Union
 
 import discord
 from discord import app_commands
@@ -37,7 +38,7 @@ class Moderation(commands.Cog):
             self.client.config["channel_id"]["staff_logs"]
         )
 
-        await logging_channel.send(embed=staff_log_embed)
+        await self.client.outbox.send(logging_channel, embed=staff_log_embed)
 
     @staticmethod
     def _has_higher_role(member: discord.Member, target: discord.Member) -> bool:
@@ -205,6 +206,59 @@ class Moderation(commands.Cog):
 
         await self.send_staff_log("Unmute", member, interaction.user, reason)
 
+    """ Purge. """
+
+    # Messages older than 14 days can't be bulk deleted, a minute of margin is kept
+    # for the time spent scanning the history.
+    BULK_DELETE_MAX_AGE = datetime.timedelta(days=14, minutes=-1)
+    BULK_DELETE_SIZE = 100
+    SINGLE_DELETE_DELAY = 1
+    DEFAULT_PURGE_SCAN_LIMIT = 2000
+    PURGE_PROGRESS_THRESHOLD = 100
+
+    async def _find_purge_candidates(
+        self,
+        channel: discord.TextChannel,
+        amount: int,
+        user: Optional[discord.User],
+        before: datetime.datetime,
+    ) -> List[discord.Message]:
+        scan_limit = self.client.config.get(
+            "purge_scan_limit", self.DEFAULT_PURGE_SCAN_LIMIT
+        )
+
+        candidates = []
+        async for message in channel.history(limit=scan_limit, before=before):
+            if user is not None and message.author.id != user.id:
+                continue
+
+            candidates.append(message)
+            if len(candidates) >= amount:
+                break
+
+        return candidates
+
+    def _plan_purge(
+        self, candidates: List[discord.Message]
+    ) -> Tuple[List[List[discord.Message]], List[discord.Message]]:
+        oldest_bulk_id = discord.utils.time_snowflake(
+            discord.utils.utcnow() - self.BULK_DELETE_MAX_AGE
+        )
+
+        bulk_messages = [
+            message for message in candidates if message.id > oldest_bulk_id
+        ]
+        single_messages = [
+            message for message in candidates if message.id <= oldest_bulk_id
+        ]
+
+        bulk_chunks = [
+            bulk_messages[i : i + self.BULK_DELETE_SIZE]
+            for i in range(0, len(bulk_messages), self.BULK_DELETE_SIZE)
+        ]
+
+        return bulk_chunks, single_messages
+
     @app_commands.command(name="purge")
     @app_commands.default_permissions()
     async def purge(
@@ -221,31 +275,49 @@ class Moderation(commands.Cog):
         # Useful so we don't delete our current interaction.
         before = discord.utils.utcnow() - datetime.timedelta(milliseconds=5)
 
-        if user is not None:
-            deleted_count = 0
-
-            def can_be_deleted(msg):
-                nonlocal deleted_count
-
-                if deleted_count >= amount:
-                    return False
+        candidates = await self._find_purge_candidates(
+            interaction.channel, amount, user, before
+        )
+        bulk_chunks, single_messages = self._plan_purge(candidates)
 
-                if msg.author.id != user.id:
-                    return False
+        progress_message = None
+        if len(candidates) > self.PURGE_PROGRESS_THRESHOLD or len(single_messages) > 0:
+            progress_message = await interaction.followup.send(
+                f"Deleting {len(candidates)} messages...", ephemeral=True, wait=True
+            )
 
+        deleted_count = 0
+
+        async def report_progress() -> None:
+            if progress_message is not None:
+                await progress_message.edit(
+                    content=f"Deleting {len(candidates)} messages... "
+                    f"({deleted_count}/{len(candidates)})"
+                )
+
+        for bulk_chunk in bulk_chunks:
+            await interaction.channel.delete_messages(bulk_chunk)
+            deleted_count += len(bulk_chunk)
+            await report_progress()
+
+        for i, message in enumerate(single_messages):
+            try:
+                await message.delete()
+            except discord.NotFound:
+                pass
+            else:
                 deleted_count += 1
 
-                return True
+            if (i + 1) % 10 == 0:
+                await report_progress()
 
-            deleted = await interaction.channel.purge(
-                limit=300, check=can_be_deleted, before=before
-            )
-        else:
-            deleted = await interaction.channel.purge(limit=amount, before=before)
+            await asyncio.sleep(self.SINGLE_DELETE_DELAY)
 
-        await interaction.followup.send(
-            f"You successfully deleted {len(deleted)} messages.", ephemeral=True
-        )
+        result = f"You successfully deleted {deleted_count} messages."
+        if progress_message is not None:
+            await progress_message.edit(content=result)
+        else:
+            await interaction.followup.send(result, ephemeral=True)
 
 
 async def setup(client):
@@ -1,8 +1,145 @@
+import datetime
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
 import motor.motor_asyncio
-import ujson
 from discord.ext import commands
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 from discord_bot_owners import DiscordBotOwners
+from metrics import timed_method
+
+log = logging.getLogger(__name__)
+
+timed_operation = timed_method("mongodb_operation_duration_seconds")
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def copy_document(value: Any) -> Any:
+    """Copy the dicts and lists of a document, other BSON values are immutable."""
+    if isinstance(value, dict):
+        return {key: copy_document(item) for key, item in value.items()}
+
+    if isinstance(value, list):
+        return [copy_document(item) for item in value]
+
+    return value
+
+
+def compile_copier(value: Any) -> Callable[[], Any]:
+    """Compile a value into a function returning fresh copies of it."""
+    if isinstance(value, dict):
+        template = dict(value)
+        mutable_items = [
+            (key, compile_copier(item))
+            for key, item in value.items()
+            if isinstance(item, (dict, list))
+        ]
+        if len(mutable_items) == 0:
+            return template.copy
+
+        def copy_dict() -> dict:
+            copied_dict = template.copy()
+            for item_key, item_copier in mutable_items:
+                copied_dict[item_key] = item_copier()
+            return copied_dict
+
+        return copy_dict
+
+    if isinstance(value, list):
+        item_copiers = [compile_copier(item) for item in value]
+        return lambda: [item_copier() for item_copier in item_copiers]
+
+    return lambda: value
+
+
+class DocumentDefaults:
+    """The default values of a document, compiled once to fill fetched documents."""
+
+    def __init__(self, default_dict: dict):
+        self.new = compile_copier(default_dict)
+
+        self._fields = []
+        for default_key, default_value in default_dict.items():
+            nested_fields = None
+            if isinstance(default_value, dict):
+                nested_fields = [
+                    (default_key_2, compile_copier(default_value_2))
+                    for default_key_2, default_value_2 in default_value.items()
+                ]
+
+            self._fields.append(
+                (default_key, compile_copier(default_value), nested_fields)
+            )
+
+    def fill(self, current_dict: dict) -> dict:
+        for default_key, default_copier, nested_fields in self._fields:
+            if default_key not in current_dict:
+                current_dict[default_key] = default_copier()
+
+            if nested_fields:
+                nested_dict = current_dict[default_key]
+                for default_key_2, default_copier_2 in nested_fields:
+                    if default_key_2 not in nested_dict:
+                        nested_dict[default_key_2] = default_copier_2()
+
+        return current_dict
+
+
+class TTLCache:
+    """A size-bounded LRU cache whose entries expire after some time."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+
+        return entry[1]
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
 
 
 class MongoDB(commands.Cog):
@@ -12,86 +149,536 @@ class MongoDB(commands.Cog):
         "_id": 0,
         "tickets_channel_id": None,
         "tickets_message_id": None,
-        "tickets": {},
         "verification_channel_id": None,
         "verification_message_id": None,
-        "pending_verification_message_ids": {},
         "auto_roles_channel_id": None,
         "auto_roles_message_id": None,
+        "command_tree_fingerprint": None,
     }
 
     DEFAULT_GUILD_MEMBER = {
         "_id": 0,
         "verification_pending": False,
         "verification_cooldown": None,
-        "verification_codes": {},
         "verification_join_code": None,
         "verification_join_inviter": None,
         "exp": 0,
         "level": 1,
     }
 
+    GUILD_DATA_DEFAULTS = DocumentDefaults(DEFAULT_GUILD_DATA)
+    GUILD_MEMBER_DEFAULTS = DocumentDefaults(DEFAULT_GUILD_MEMBER)
+
+    LEADERBOARD_SORT = [("level", -1), ("exp", -1), ("_id", 1)]
+
+    GUILD_MEMBER_CACHE_SIZE = 10000
+    GUILD_MEMBER_CACHE_TTL = 600
+
     def __init__(self, client: DiscordBotOwners):
         self.client = client
         self.db = motor.motor_asyncio.AsyncIOMotorClient(
             self.client.config["mongodb_uri"]
         )["discordbotowners"]
 
+        # The guild data is read on most interactions, so a copy is kept in memory and
+        # updated along with the document.
+        self._guild_data_cache: Optional[dict] = None
+        self._guild_data_version = 0
+
+        self.guild_member_cache = TTLCache(
+            self.GUILD_MEMBER_CACHE_SIZE, self.GUILD_MEMBER_CACHE_TTL
+        )
+        self._guild_member_version = 0
+
+    async def cog_load(self) -> None:
+        for stat in ("hits", "misses", "evictions", "expirations"):
+            self.client.metrics.register(
+                f"mongodb_guild_member_cache_{stat}_total",
+                lambda stat=stat: getattr(self.guild_member_cache, stat),
+                "counter",
+            )
+        self.client.metrics.register(
+            "mongodb_guild_member_cache_size", lambda: len(self.guild_member_cache)
+        )
+
+        # Members who only ever gained exp before levels were stored have no level.
+        await self.db["guild_member"].update_many(
+            {"exp": {"$exists": True}, "level": {"$exists": False}},
+            {"$set": {"level": 1}},
+        )
+        await self.db["guild_member"].create_index(self.LEADERBOARD_SORT)
+        await self.db["guild_member"].create_index(
+            [("verification_join_inviter", 1), ("_id", 1)]
+        )
+
+        await self.db["pending_verifications"].create_index("user_id")
+        await self._migrate_pending_verifications()
+
+        await self.db["tickets"].create_index("channel_id", unique=True)
+        await self.db["tickets"].create_index(
+            [("category", 1), ("user_id", 1)], unique=True
+        )
+        await self._migrate_tickets()
+
+        await self.db["verification_codes"].create_index("owner_id")
+        await self._migrate_verification_codes()
+
     @staticmethod
-    def _set_default_dict(current_dict, default_dict):
-        for default_key, default_value in default_dict.items():
-            if default_key not in current_dict.keys():
-                current_dict[default_key] = ujson.loads(ujson.dumps(default_value))
+    def _apply_update(document, query) -> bool:
+        if any(operator not in {"$set", "$unset", "$inc"} for operator in query):
+            return False
 
-            if isinstance(default_value, dict):
-                for default_key_2, default_value_2 in default_value.items():
-                    if default_key_2 not in current_dict[default_key].keys():
-                        current_dict[default_key][default_key_2] = ujson.loads(
-                            ujson.dumps(default_value_2)
-                        )
+        for operator, fields in query.items():
+            for path, value in fields.items():
+                *parent_keys, key = path.split(".")
 
-        return current_dict
+                current = document
+                for parent_key in parent_keys:
+                    if not isinstance(current.get(parent_key), dict):
+                        if operator == "$unset":
+                            break
+                        current[parent_key] = {}
+                    current = current[parent_key]
+                else:
+                    if operator == "$set":
+                        current[key] = copy_document(value)
+                    elif operator == "$unset":
+                        current.pop(key, None)
+                    else:
+                        current[key] = current.get(key, 0) + value
+
+        return True
 
     """ Guild Data collection """
 
+    @timed_operation
     async def fetch_guild_data(self):
+        if self._guild_data_cache is not None:
+            return copy_document(self._guild_data_cache)
+
+        version = self._guild_data_version
         guild_data = await self.db["guild_data"].find_one(
             {"_id": str(self.client.config["guild_id"])}
         )
         if guild_data is not None:
-            guild_data = self._set_default_dict(guild_data, self.DEFAULT_GUILD_DATA)
+            guild_data = self.GUILD_DATA_DEFAULTS.fill(guild_data)
         else:
-            guild_data = ujson.loads(ujson.dumps(self.DEFAULT_GUILD_DATA))
+            guild_data = self.GUILD_DATA_DEFAULTS.new()
 
         guild_data["_id"] = int(self.client.config["guild_id"])
 
+        # Don't cache the document if it was updated while it was being read.
+        if version == self._guild_data_version:
+            self._guild_data_cache = copy_document(guild_data)
+
         return guild_data
 
+    @timed_operation
     async def update_guild_data_document(self, query):
         await self.db["guild_data"].update_one(
             {"_id": str(self.client.config["guild_id"])}, query, upsert=True
         )
 
+        self._guild_data_version += 1
+        if self._guild_data_cache is not None and not self._apply_update(
+            self._guild_data_cache, query
+        ):
+            self._guild_data_cache = None
+
+    async def _insert_migrated_documents(
+        self, collection: str, documents: List[dict]
+    ) -> Optional[List[dict]]:
+        """Insert documents moved from an older schema, returning the ones already there.
+
+        None is returned if some of them couldn't be inserted for another reason, the
+        errors are logged and the old data should be kept to try again.
+        """
+        if len(documents) == 0:
+            return []
+
+        try:
+            await self.db[collection].bulk_write(
+                [InsertOne(document) for document in documents], ordered=False
+            )
+        except BulkWriteError as e:
+            duplicates = []
+            failed = False
+            for error in e.details["writeErrors"]:
+                if error.get("code") == DUPLICATE_KEY_ERROR:
+                    duplicates.append(documents[error["index"]])
+                else:
+                    failed = True
+                    log.error(
+                        "Failed to migrate %s to the %s collection: %s",
+                        documents[error["index"]],
+                        collection,
+                        error.get("errmsg"),
+                    )
+
+            return None if failed else duplicates
+
+        return []
+
+    async def _migrate_pending_verifications(self) -> None:
+        # Pending verifications used to be stored in the guild data document.
+        guild_data = await self.fetch_guild_data()
+        if "pending_verification_message_ids" not in guild_data:
+            return
+
+        # The duplicates were moved by a previous run.
+        if (
+            await self._insert_migrated_documents(
+                "pending_verifications",
+                [
+                    {"_id": message_id, "user_id": user_id}
+                    for message_id, user_id in guild_data[
+                        "pending_verification_message_ids"
+                    ].items()
+                ],
+            )
+            is None
+        ):
+            return
+
+        await self.update_guild_data_document(
+            {"$unset": {"pending_verification_message_ids": ""}}
+        )
+
+    async def _migrate_tickets(self) -> None:
+        # Tickets used to be stored in the guild data document.
+        guild_data = await self.fetch_guild_data()
+        if "tickets" not in guild_data:
+            return
+
+        # The duplicates were moved by a previous run.
+        if (
+            await self._insert_migrated_documents(
+                "tickets",
+                [
+                    {
+                        "channel_id": channel_id,
+                        "category": category,
+                        "user_id": int(user_id),
+                    }
+                    for category, category_tickets in guild_data["tickets"].items()
+                    for user_id, channel_id in category_tickets.items()
+                ],
+            )
+            is None
+        ):
+            return
+
+        await self.update_guild_data_document({"$unset": {"tickets": ""}})
+
+    async def _migrate_verification_codes(self) -> None:
+        # Verification codes used to be stored in the document of their owner, they
+        # were only unique by owner.
+        verification_codes = []
+        async for guild_member in self.db["guild_member"].find(
+            {"verification_codes": {"$exists": True}}, {"verification_codes": 1}
+        ):
+            for code, user_id in guild_member["verification_codes"].items():
+                verification_codes.append(
+                    {
+                        "_id": code,
+                        "owner_id": int(guild_member["_id"]),
+                        "user_id": user_id,
+                    }
+                )
+
+        duplicates = await self._insert_migrated_documents(
+            "verification_codes", verification_codes
+        )
+        if duplicates is None:
+            return
+
+        # A duplicate was either moved by a previous run, or is the same code as the
+        # one of another owner. The codes of the owners with such a conflict are kept
+        # where they were, so they can be resolved by hand.
+        kept_owner_ids = set()
+        for verification_code in duplicates:
+            existing_code = await self.db["verification_codes"].find_one(
+                {"_id": verification_code["_id"]}
+            )
+            if (
+                existing_code is not None
+                and existing_code["owner_id"] == verification_code["owner_id"]
+            ):
+                continue
+
+            kept_owner_ids.add(str(verification_code["owner_id"]))
+            log.warning(
+                "The verification code %s of %s is already the code of %s, it "
+                "wasn't migrated.",
+                verification_code["_id"],
+                verification_code["owner_id"],
+                existing_code["owner_id"] if existing_code is not None else None,
+            )
+
+        await self.db["guild_member"].update_many(
+            {
+                "_id": {"$nin": list(kept_owner_ids)},
+                "verification_codes": {"$exists": True},
+            },
+            {"$unset": {"verification_codes": ""}},
+        )
+
     """ Guild Member collection """
 
+    @timed_operation
     async def fetch_guild_member(self, member_id: int):
+        cached_guild_member = self.guild_member_cache.get(member_id)
+        if cached_guild_member is not None:
+            return copy_document(cached_guild_member)
+
+        version = self._guild_member_version
         guild_member = await self.db["guild_member"].find_one({"_id": str(member_id)})
         if guild_member is not None:
-            guild_member = self._set_default_dict(
-                guild_member, self.DEFAULT_GUILD_MEMBER
-            )
+            guild_member = self.GUILD_MEMBER_DEFAULTS.fill(guild_member)
         else:
-            guild_member = ujson.loads(ujson.dumps(self.DEFAULT_GUILD_MEMBER))
+            guild_member = self.GUILD_MEMBER_DEFAULTS.new()
 
         guild_member["_id"] = member_id
 
+        if version == self._guild_member_version:
+            self.guild_member_cache.set(member_id, copy_document(guild_member))
+
         return guild_member
 
+    @timed_operation
     async def update_guild_member_document(self, member_id: int, query):
         await self.db["guild_member"].update_one(
             {"_id": str(member_id)}, query, upsert=True
         )
 
+        self._guild_member_version += 1
+        cached_guild_member = self.guild_member_cache.peek(member_id)
+        if cached_guild_member is not None and not self._apply_update(
+            cached_guild_member, query
+        ):
+            self.guild_member_cache.pop(member_id)
+
+    @timed_operation
+    async def update_guild_member_documents(self, queries: Dict[int, dict]):
+        """Update many members in an unordered bulk write, in the order of the queries.
+
+        The indexes of the write errors of a BulkWriteError are positions in the queries.
+        """
+        if len(queries) == 0:
+            return
+
+        try:
+            await self.db["guild_member"].bulk_write(
+                [
+                    UpdateOne({"_id": str(member_id)}, query, upsert=True)
+                    for member_id, query in queries.items()
+                ],
+                ordered=False,
+            )
+        finally:
+            # Some of the updates may have been applied even if the write failed.
+            self._guild_member_version += 1
+            for member_id in queries.keys():
+                self.guild_member_cache.pop(member_id)
+
+    @timed_operation
+    async def fetch_verification_states(self) -> List[dict]:
+        """Fetch the members with a pending verification or on cooldown."""
+        verification_states = []
+        async for guild_member in self.db["guild_member"].find(
+            {
+                "$or": [
+                    {"verification_pending": True},
+                    {"verification_cooldown": {"$gt": datetime.datetime.now()}},
+                ]
+            },
+            {"verification_pending": 1, "verification_cooldown": 1},
+        ):
+            guild_member["_id"] = int(guild_member["_id"])
+            verification_states.append(guild_member)
+
+        return verification_states
+
+    @timed_operation
+    async def fetch_code_joined_member_ids(self) -> Set[int]:
+        """Fetch the members who joined with a verification code, by ID."""
+        return {
+            int(guild_member["_id"])
+            async for guild_member in self.db["guild_member"].find(
+                {"verification_join_code": {"$ne": None}}, {"_id": 1}
+            )
+        }
+
+    @timed_operation
+    async def fetch_team_member_ids(
+        self, inviter_id: int, after: Optional[int] = None, limit: int = 0
+    ) -> List[int]:
+        """Fetch the members who joined with a code of a bot owner, by ID."""
+        query = {"verification_join_inviter": inviter_id}
+        if after is not None:
+            query["_id"] = {"$gt": str(after)}
+
+        cursor = (
+            self.db["guild_member"].find(query, {"_id": 1}).sort("_id", 1).limit(limit)
+        )
+        return [int(guild_member["_id"]) async for guild_member in cursor]
+
+    @timed_operation
+    async def fetch_leaderboard(
+        self, after: Optional[Tuple[int, int, str]], limit: int
+    ) -> List[dict]:
+        query = {"exp": {"$gt": 0}}
+        if after is not None:
+            level, exp, member_id = after
+            query["$or"] = [
+                {"level": {"$lt": level}},
+                {"level": level, "exp": {"$lt": exp}},
+                {"level": level, "exp": exp, "_id": {"$gt": member_id}},
+            ]
+
+        cursor = (
+            self.db["guild_member"]
+            .find(query, {"level": 1, "exp": 1})
+            .sort(self.LEADERBOARD_SORT)
+            .limit(limit)
+        )
+        return await cursor.to_list(length=limit)
+
+    @timed_operation
+    async def fetch_guild_member_rank(self, level: int, exp: int) -> int:
+        members_ahead = await self.db["guild_member"].count_documents(
+            {"$or": [{"level": {"$gt": level}}, {"level": level, "exp": {"$gt": exp}}]}
+        )
+        return members_ahead + 1
+
+    """ Pending Verifications collection """
+
+    @timed_operation
+    async def fetch_pending_verification(self, message_id: int) -> Optional[int]:
+        pending_verification = await self.db["pending_verifications"].find_one(
+            {"_id": str(message_id)}
+        )
+        if pending_verification is None:
+            return None
+
+        return pending_verification["user_id"]
+
+    @timed_operation
+    async def fetch_pending_verifications(self) -> List[dict]:
+        pending_verifications = []
+        async for pending_verification in self.db["pending_verifications"].find():
+            pending_verification["_id"] = int(pending_verification["_id"])
+            pending_verifications.append(pending_verification)
+
+        return pending_verifications
+
+    @timed_operation
+    async def insert_pending_verification(self, message_id: int, user_id: int):
+        await self.db["pending_verifications"].insert_one(
+            {"_id": str(message_id), "user_id": user_id}
+        )
+
+    @timed_operation
+    async def delete_pending_verification(self, message_id: int):
+        await self.db["pending_verifications"].delete_one({"_id": str(message_id)})
+
+    @timed_operation
+    async def delete_pending_verifications(self, message_ids: List[int]):
+        await self.db["pending_verifications"].delete_many(
+            {"_id": {"$in": [str(message_id) for message_id in message_ids]}}
+        )
+
+    """ Verification Codes collection """
+
+    @timed_operation
+    async def fetch_verification_code(self, code: str) -> Optional[dict]:
+        return await self.db["verification_codes"].find_one({"_id": code})
+
+    @timed_operation
+    async def fetch_verification_codes(self, owner_id: int) -> List[dict]:
+        return (
+            await self.db["verification_codes"]
+            .find({"owner_id": owner_id})
+            .to_list(length=None)
+        )
+
+    @timed_operation
+    async def insert_verification_codes(self, owner_id: int, codes: List[str]) -> int:
+        """Insert new codes, returning how many of them were not already taken."""
+        try:
+            result = await self.db["verification_codes"].insert_many(
+                [
+                    {"_id": code, "owner_id": owner_id, "user_id": None}
+                    for code in codes
+                ],
+                ordered=False,
+            )
+        except BulkWriteError as e:
+            return e.details["nInserted"]
+
+        return len(result.inserted_ids)
+
+    @timed_operation
+    async def redeem_verification_code(self, code: str, user_id: int) -> Optional[dict]:
+        """Claim an unused code, returning it unless it doesn't exist or was used."""
+        return await self.db["verification_codes"].find_one_and_update(
+            {"_id": code, "user_id": None}, {"$set": {"user_id": user_id}}
+        )
+
+    @timed_operation
+    async def delete_verification_code(self, code: str):
+        await self.db["verification_codes"].delete_one({"_id": code})
+
+    """ Tickets collection """
+
+    @timed_operation
+    async def fetch_ticket(self, category: str, user_id: int) -> Optional[dict]:
+        return await self.db["tickets"].find_one(
+            {"category": category, "user_id": user_id}
+        )
+
+    @timed_operation
+    async def insert_ticket(self, channel_id: int, category: str, user_id: int) -> bool:
+        try:
+            await self.db["tickets"].insert_one(
+                {"channel_id": channel_id, "category": category, "user_id": user_id}
+            )
+        except DuplicateKeyError:
+            return False
+
+        return True
+
+    @timed_operation
+    async def delete_ticket(self, channel_id: int) -> Optional[dict]:
+        return await self.db["tickets"].find_one_and_delete({"channel_id": channel_id})
+
+    """ Transcript Jobs collection """
+
+    @timed_operation
+    async def fetch_transcript_jobs(self) -> List[dict]:
+        transcript_jobs = []
+        async for transcript_job in self.db["transcript_jobs"].find():
+            transcript_job["_id"] = int(transcript_job["_id"])
+            transcript_jobs.append(transcript_job)
+
+        return transcript_jobs
+
+    @timed_operation
+    async def insert_transcript_job(self, transcript_job: dict):
+        await self.db["transcript_jobs"].insert_one(
+            {**transcript_job, "_id": str(transcript_job["_id"])}
+        )
+
+    @timed_operation
+    async def set_transcript_job_posted(self, channel_id: int):
+        await self.db["transcript_jobs"].update_one(
+            {"_id": str(channel_id)}, {"$set": {"posted": True}}
+        )
+
+    @timed_operation
+    async def delete_transcript_job(self, channel_id: int):
+        await self.db["transcript_jobs"].delete_one({"_id": str(channel_id)})
+
 
 async def setup(client):
     await client.add_cog(MongoDB(client))
@@ -0,0 +1,117 @@
+import asyncio
+import collections
+from typing import Deque, Dict, List, Optional, Tuple
+
+import discord
+from discord.ext import commands
+
+from discord_bot_owners import DiscordBotOwners
+
+PendingMessage = Tuple[Optional[str], Optional[discord.Embed], asyncio.Future]
+
+
+class Outbox(commands.Cog):
+    """The cog to merge the messages sent to the same channel."""
+
+    MAX_CONTENT_LENGTH = 2000
+    MAX_EMBEDS = 10
+    MAX_EMBEDS_LENGTH = 6000
+
+    # While a channel has a backlog, wait a bit so more messages are merged together.
+    COALESCE_WINDOW = 0.5
+
+    def __init__(self, client: DiscordBotOwners):
+        self.client = client
+
+        self._pending_messages: Dict[int, Deque[PendingMessage]] = {}
+        self._senders: Dict[int, asyncio.Task] = {}
+
+    async def cog_unload(self) -> None:
+        await asyncio.gather(*self._senders.values(), return_exceptions=True)
+
+    async def send(
+        self,
+        channel: discord.abc.Messageable,
+        content: Optional[str] = None,
+        *,
+        embed: Optional[discord.Embed] = None,
+    ) -> None:
+        """Send a message to a channel, merged with the ones waiting to be sent to it."""
+        future = self.client.loop.create_future()
+        self._pending_messages.setdefault(channel.id, collections.deque()).append(
+            (content, embed, future)
+        )
+
+        if channel.id not in self._senders:
+            self._senders[channel.id] = self.client.loop.create_task(
+                self._sender(channel)
+            )
+
+        await future
+
+    def _take_batch(
+        self, pending_messages: Deque[PendingMessage]
+    ) -> Tuple[List[str], List[discord.Embed], List[asyncio.Future]]:
+        lines, embeds, futures = [], [], []
+        content_length = 0
+        embeds_length = 0
+
+        while len(pending_messages) > 0:
+            content, embed, future = pending_messages[0]
+
+            if len(futures) > 0:
+                if (
+                    content is not None
+                    and content_length + len(content) + 1 > self.MAX_CONTENT_LENGTH
+                ):
+                    break
+
+                if embed is not None and (
+                    len(embeds) == self.MAX_EMBEDS
+                    or embeds_length + len(embed) > self.MAX_EMBEDS_LENGTH
+                ):
+                    break
+
+            pending_messages.popleft()
+
+            if content is not None:
+                lines.append(content)
+                content_length += len(content) + 1
+            if embed is not None:
+                embeds.append(embed)
+                embeds_length += len(embed)
+            futures.append(future)
+
+        return lines, embeds, futures
+
+    async def _sender(self, channel: discord.abc.Messageable) -> None:
+        pending_messages = self._pending_messages[channel.id]
+
+        try:
+            while len(pending_messages) > 0:
+                lines, embeds, futures = self._take_batch(pending_messages)
+
+                try:
+                    await channel.send(
+                        content="\n".join(lines) if len(lines) > 0 else None,
+                        embeds=embeds,
+                    )
+                except Exception as e:
+                    for future in futures:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for future in futures:
+                        if not future.done():
+                            future.set_result(None)
+
+                if len(pending_messages) > 0:
+                    await asyncio.sleep(self.COALESCE_WINDOW)
+        finally:
+            del self._senders[channel.id]
+            if len(pending_messages) == 0:
+                del self._pending_messages[channel.id]
+
+
+async def setup(client):
+    await client.add_cog(Outbox(client))
@@ -0,0 +1,62 @@
+import time
+
+import discord
+from discord.ext import commands
+
+from discord_bot_owners import DiscordBotOwners
+
+
+class Owner(commands.Cog):
+    """The cog with the tools of the bot owner."""
+
+    def __init__(self, client: DiscordBotOwners):
+        self.client = client
+
+    async def cog_check(self, ctx: commands.Context) -> bool:
+        return await self.client.is_owner(ctx.author)
+
+    @commands.command(name="sync")
+    async def sync(self, ctx: commands.Context):
+        """Sync the application commands, even if they didn't change."""
+        await self.client.sync_guild(force=True)
+        await ctx.send("The application commands have been synced.")
+
+    @commands.command(name="lag")
+    async def lag(self, ctx: commands.Context):
+        """Show how late the event loop is and what blocked it recently."""
+        loop_monitor = self.client.loop_monitor
+        lag_percentiles = loop_monitor.lag_percentiles()
+        if lag_percentiles is None:
+            return await ctx.send("The event loop lag hasn't been measured yet.")
+
+        description = (
+            f"Over the last {len(loop_monitor.lag_samples)} samples:\n"
+            + "\n".join(
+                f"**{name}**: {lag * 1000:.1f}ms"
+                for name, lag in lag_percentiles.items()
+            )
+        )
+
+        lag_embed = discord.Embed(
+            title="Event loop lag",
+            description=description,
+            color=self.client.color,
+            timestamp=discord.utils.utcnow(),
+        )
+
+        now = time.monotonic()
+        for slow_callback in list(loop_monitor.slow_callbacks)[-3:]:
+            stack = slow_callback.stack or "The stack wasn't captured."
+            lag_embed.add_field(
+                name=f"Blocked {slow_callback.duration:.2f}s by "
+                f"{slow_callback.task_name or 'a callback'}, "
+                f"{now - slow_callback.blocked_at:.0f}s ago",
+                value=f"```py\n{stack[-900:]}```",
+                inline=False,
+            )
+
+        await ctx.send(embed=lag_embed)
+
+
+async def setup(client):
+    await client.add_cog(Owner(client))
@@ -0,0 +1,112 @@
+import asyncio
+from typing import Dict, Iterable, List, Tuple
+
+import discord
+from discord.ext import commands
+
+from discord_bot_owners import DiscordBotOwners
+
+# The role and whether it is added or removed, by role ID.
+RoleChanges = Dict[int, Tuple[discord.Role, bool]]
+
+
+class RoleQueue(commands.Cog):
+    """The cog to merge the role changes of a member into a single edit."""
+
+    # The changes made during the window are merged with the first one.
+    COALESCE_WINDOW = 0.5
+
+    def __init__(self, client: DiscordBotOwners):
+        self.client = client
+
+        self._pending_changes: Dict[int, RoleChanges] = {}
+        self._pending_futures: Dict[int, List[asyncio.Future]] = {}
+        self._applying_changes: Dict[int, RoleChanges] = {}
+        self._editors: Dict[int, asyncio.Task] = {}
+
+    async def cog_unload(self) -> None:
+        await asyncio.gather(*self._editors.values(), return_exceptions=True)
+
+    def edit_roles(
+        self,
+        member: discord.Member,
+        *,
+        add: Iterable[discord.Role] = (),
+        remove: Iterable[discord.Role] = (),
+    ) -> asyncio.Future:
+        """Queue role changes for a member, the future is done once they are applied."""
+        future = self.client.loop.create_future()
+
+        pending_changes = self._pending_changes.setdefault(member.id, {})
+        for role in remove:
+            pending_changes[role.id] = (role, False)
+        for role in add:
+            pending_changes[role.id] = (role, True)
+        self._pending_futures.setdefault(member.id, []).append(future)
+
+        if member.id not in self._editors:
+            self._editors[member.id] = self.client.loop.create_task(
+                self._editor(member)
+            )
+
+        return future
+
+    def has_role(self, member: discord.Member, role: discord.Role) -> bool:
+        """Whether a member has a role, once the queued changes are applied."""
+        for changes in (
+            self._pending_changes.get(member.id),
+            self._applying_changes.get(member.id),
+        ):
+            if changes is not None and role.id in changes:
+                return changes[role.id][1]
+
+        return member.get_role(role.id) is not None
+
+    async def _apply_changes(self, member: discord.Member, changes: RoleChanges):
+        current_roles = {
+            role.id: role for role in member.roles if not role.is_default()
+        }
+
+        roles = dict(current_roles)
+        for role_id, (role, added) in changes.items():
+            if added:
+                roles[role_id] = role
+            else:
+                roles.pop(role_id, None)
+
+        if roles.keys() == current_roles.keys():
+            return
+
+        await member.edit(roles=list(roles.values()))
+        self.client.metrics.increment("discord_role_edits_total")
+
+    async def _editor(self, member: discord.Member) -> None:
+        try:
+            while member.id in self._pending_changes:
+                await asyncio.sleep(self.COALESCE_WINDOW)
+
+                changes = self._pending_changes.pop(member.id)
+                futures = self._pending_futures.pop(member.id)
+                self._applying_changes[member.id] = changes
+
+                # The cached member has the roles given since the changes were queued.
+                member = member.guild.get_member(member.id) or member
+
+                try:
+                    await self._apply_changes(member, changes)
+                except Exception as e:
+                    for future in futures:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for future in futures:
+                        if not future.done():
+                            future.set_result(None)
+                finally:
+                    del self._applying_changes[member.id]
+        finally:
+            del self._editors[member.id]
+
+
+async def setup(client):
+    await client.add_cog(RoleQueue(client))
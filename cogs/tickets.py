@@ -1,4 +1,11 @@
-import io
+import asyncio
+import gzip
+import logging
+import math
+import shutil
+import tempfile
+import time
+from typing import IO, Dict, List, Optional, Set
 
 import chat_exporter
 import discord
@@ -6,21 +13,30 @@ from discord import app_commands
 from discord.ext import commands
 
 from discord_bot_owners import DiscordBotOwners
+from metrics import timed_callback
+from throttle import Throttle, throttled_callback
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+log = logging.getLogger(__name__)
+
+TICKETS_THROTTLE = Throttle("tickets", rate=2, per=30, global_rate=5, global_per=1)
 
 
 async def create_ticket(
     interaction: discord.Interaction, category: str, stars: str = None
 ) -> None:
-    guild_data = await interaction.client.mongo.fetch_guild_data()
-    if category in guild_data["tickets"]:
-        current_ticket_id = guild_data["tickets"][category].get(
-            str(interaction.user.id)
+    current_ticket = await interaction.client.mongo.fetch_ticket(
+        category, interaction.user.id
+    )
+    if current_ticket is not None:
+        return await interaction.response.send_message(
+            f"You already have a ticket opened in this category, <#{current_ticket['channel_id']}>.",
+            ephemeral=True,
         )
-        if current_ticket_id is not None:
-            return await interaction.response.send_message(
-                f"You already have a ticket opened in this category, <#{current_ticket_id}>.",
-                ephemeral=True,
-            )
 
     if stars is not None and stars not in {"1", "2", "3"}:
         return await interaction.response.send_message(
@@ -62,9 +78,14 @@ async def create_ticket(
         ticket_name, overwrites=overwrites, category=tickets_category
     )
 
-    await interaction.client.mongo.update_guild_data_document(
-        {"$set": {f"tickets.{category}.{interaction.user.id}": ticket_channel.id}}
-    )
+    if not await interaction.client.mongo.insert_ticket(
+        ticket_channel.id, category, interaction.user.id
+    ):
+        # Another ticket was opened in this category while this one was created.
+        await ticket_channel.delete()
+        return await interaction.edit_original_response(
+            content="You already have a ticket opened in this category."
+        )
 
     ticket_embed = discord.Embed(
         title=f"Ticket",
@@ -92,6 +113,89 @@ async def create_ticket(
     )
 
 
+""" Transcripts. """
+
+TRANSCRIPT_CHUNK_SIZE = 64 * 1024
+
+
+def write_transcript(raw_transcript: str, compression: Optional[str]) -> IO[bytes]:
+    """Write a transcript to a temporary file, chunk by chunk, compressing it if asked."""
+    transcript_file = tempfile.TemporaryFile()
+
+    if compression == "gzip":
+        writer = gzip.GzipFile(fileobj=transcript_file, mode="wb")
+    elif compression == "zstd" and zstandard is not None:
+        writer = zstandard.ZstdCompressor().stream_writer(
+            transcript_file, closefd=False
+        )
+    else:
+        writer = transcript_file
+
+    for start in range(0, len(raw_transcript), TRANSCRIPT_CHUNK_SIZE):
+        writer.write(raw_transcript[start : start + TRANSCRIPT_CHUNK_SIZE].encode())
+
+    if writer is not transcript_file:
+        writer.close()
+
+    transcript_file.seek(0)
+    return transcript_file
+
+
+class _LimitedReader:
+    def __init__(self, file: IO[bytes], limit: int):
+        self.file = file
+        self.remaining = limit
+
+    def read(self, size: int) -> bytes:
+        data = self.file.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+
+def split_transcript(
+    transcript_file: IO[bytes], filename: str, size_limit: int
+) -> List[discord.File]:
+    """Split a transcript file into files fitting in the upload limit.
+
+    The file is cut at byte offsets, so the parts have to be joined back together
+    before the transcript can be decompressed or opened.
+    """
+    size = transcript_file.seek(0, 2)
+    transcript_file.seek(0)
+
+    if size <= size_limit:
+        return [discord.File(transcript_file, filename=filename)]
+
+    parts = []
+    for part_number in range(1, math.ceil(size / size_limit) + 1):
+        part_file = tempfile.TemporaryFile()
+        shutil.copyfileobj(
+            _LimitedReader(transcript_file, size_limit),
+            part_file,
+            TRANSCRIPT_CHUNK_SIZE,
+        )
+        part_file.seek(0)
+        parts.append(discord.File(part_file, filename=f"{filename}.{part_number:03}"))
+
+    transcript_file.close()
+    return parts
+
+
+def build_transcript_files(
+    raw_transcript: str,
+    filename: str,
+    compression: Optional[str],
+    size_limit: int,
+) -> List[discord.File]:
+    if compression == "gzip":
+        filename += ".gz"
+    elif compression == "zstd" and zstandard is not None:
+        filename += ".zst"
+
+    transcript_file = write_transcript(raw_transcript, compression)
+    return split_transcript(transcript_file, filename, size_limit)
+
+
 """ Tickets view. """
 
 
@@ -105,6 +209,8 @@ class TicketsView(discord.ui.View):
         style=discord.ButtonStyle.blurple,
         custom_id="persisten:support",
     )
+    @timed_callback
+    @throttled_callback(TICKETS_THROTTLE)
     async def support(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ) -> None:
@@ -114,15 +220,47 @@ class TicketsView(discord.ui.View):
 class Tickets(commands.Cog):
     """The cog to manage tickets."""
 
+    # Closed tickets are handled in the background by a few workers, the jobs are
+    # stored in the database so they are resumed after a restart. The exports run on
+    # the event loop, only one of them runs at a time so the loop isn't stalled by
+    # several of them at once.
+    TRANSCRIPT_WORKERS = 2
+
+    # A failed job is queued again later, waiting twice as long after each failure.
+    TRANSCRIPT_RETRY_DELAY = 30
+    TRANSCRIPT_MAX_RETRY_DELAY = 3600
+
     def __init__(self, client: DiscordBotOwners):
         self.client = client
 
+        self.transcript_queue: "asyncio.Queue[dict]" = asyncio.Queue()
+        self._transcript_export_lock = asyncio.Lock()
+        self._transcript_workers: List[asyncio.Task] = []
+        self._transcript_failures: Dict[int, int] = {}
+        self._transcript_retries: Set[asyncio.Task] = set()
+
     async def cog_load(self) -> None:
-        self.client.loop.create_task(self.after_ready())
+        self.client.add_ready_task("view rehydration tickets", self.after_ready)
+        self.client.metrics.register(
+            "ticket_transcript_queue_depth", self.transcript_queue.qsize
+        )
+
+    async def cog_unload(self) -> None:
+        # The jobs are still in the database, they are queued again once reloaded.
+        for task in (*self._transcript_workers, *self._transcript_retries):
+            task.cancel()
 
     async def after_ready(self) -> None:
         await self.client.wait_until_ready()
 
+        for transcript_job in await self.client.mongo.fetch_transcript_jobs():
+            self.transcript_queue.put_nowait(transcript_job)
+
+        for _ in range(self.TRANSCRIPT_WORKERS):
+            self._transcript_workers.append(
+                self.client.loop.create_task(self.transcript_worker())
+            )
+
         guild_data = await self.client.mongo.fetch_guild_data()
         if guild_data["tickets_message_id"] is None:
             return
@@ -142,6 +280,142 @@ class Tickets(commands.Cog):
         )
         await self.client.reload_extension("cogs.tickets")
 
+    """ Transcripts worker. """
+
+    async def transcript_worker(self) -> None:
+        while True:
+            transcript_job = await self.transcript_queue.get()
+
+            start = time.perf_counter()
+            try:
+                await self.process_transcript_job(transcript_job)
+            except Exception:
+                self.retry_transcript_job(transcript_job)
+            else:
+                self._transcript_failures.pop(transcript_job["_id"], None)
+
+                render_time = time.perf_counter() - start
+                self.client.metrics.observe(
+                    "ticket_transcript_duration_seconds", render_time
+                )
+                log.info(
+                    "Processed the transcript of the ticket %s in %.2fs, %d job(s) queued.",
+                    transcript_job["_id"],
+                    render_time,
+                    self.transcript_queue.qsize(),
+                )
+            finally:
+                self.transcript_queue.task_done()
+
+    def retry_transcript_job(self, transcript_job: dict) -> None:
+        failures = self._transcript_failures.get(transcript_job["_id"], 0) + 1
+        self._transcript_failures[transcript_job["_id"]] = failures
+
+        delay = min(
+            self.TRANSCRIPT_RETRY_DELAY * 2 ** (failures - 1),
+            self.TRANSCRIPT_MAX_RETRY_DELAY,
+        )
+        log.exception(
+            "Failed to process the transcript of the ticket %s (%d failure(s)), "
+            "retrying in %ds.",
+            transcript_job["_id"],
+            failures,
+            delay,
+        )
+
+        async def requeue() -> None:
+            await asyncio.sleep(delay)
+            self.transcript_queue.put_nowait(transcript_job)
+
+        task = self.client.loop.create_task(requeue())
+        self._transcript_retries.add(task)
+        task.add_done_callback(self._transcript_retries.discard)
+
+    async def process_transcript_job(self, transcript_job: dict) -> None:
+        guild = self.client.get_guild(self.client.config["guild_id"])
+        channel = guild.get_channel(transcript_job["_id"])
+
+        # The log of a job retried after it was posted isn't posted again.
+        if not transcript_job.get("posted", False):
+            await self.post_transcript(guild, channel, transcript_job)
+
+            transcript_job["posted"] = True
+            await self.client.mongo.set_transcript_job_posted(transcript_job["_id"])
+
+        # The channel is only deleted once its transcript has been posted, a job
+        # failing before is retried with the channel still there.
+        if channel is not None:
+            try:
+                await channel.delete()
+            except discord.NotFound:
+                pass
+
+        await self.client.mongo.delete_transcript_job(transcript_job["_id"])
+
+    async def post_transcript(
+        self,
+        guild: discord.Guild,
+        channel: Optional[discord.TextChannel],
+        transcript_job: dict,
+    ) -> None:
+        # A failed export fails the job, it is retried while the channel exists.
+        transcripts = []
+        if channel is not None:
+            async with self._transcript_export_lock:
+                raw_transcript = await chat_exporter.export(channel)
+
+            if raw_transcript is not None:
+                transcripts = await asyncio.to_thread(
+                    build_transcript_files,
+                    raw_transcript,
+                    f"transcript-{channel.id}.html",
+                    self.client.config.get("transcript_compression"),
+                    guild.filesize_limit,
+                )
+                del raw_transcript
+
+        logs_channel = guild.get_channel(
+            self.client.config["channel_id"]["ticket_logs"]
+        )
+
+        user_id = transcript_job["user_id"]
+        user = await self.client.get_or_fetch_member(guild, user_id)
+        user_msg = f"**User**: <@{user_id}>\n"
+        if user is not None:
+            user_msg = f"**User**: <@{user.id}> / {user.name}#{user.discriminator}\n"
+
+        closer_id = transcript_job["closer_id"]
+        closer = await self.client.get_or_fetch_member(guild, closer_id)
+        closer_msg = f"**Closed by**: <@{closer_id}>\n"
+        if closer is not None:
+            closer_msg = f"**Closed by**: {closer.mention} / {closer.name}#{closer.discriminator}\n"
+
+        transcript_msg = "*see attachments*"
+        if len(transcripts) > 1:
+            # The name of the parts without their number.
+            filename = transcripts[0].filename.rsplit(".", 1)[0]
+            transcript_msg = (
+                f"*see attachments, the {len(transcripts)} parts can't be opened "
+                f"alone, join them with* `cat {filename}.* > {filename}`"
+            )
+
+        embed_log = discord.Embed(
+            title="Ticket",
+            description=f"{user_msg}"
+            f"{closer_msg}"
+            f"**Category**: {transcript_job['category']}\n"
+            f"**Transcript**: {transcript_msg}\n",
+            color=self.client.color,
+            timestamp=discord.utils.utcnow(),
+        )
+
+        if len(transcripts) > 0:
+            await logs_channel.send(embed=embed_log, file=transcripts[0])
+            for transcript in transcripts[1:]:
+                await logs_channel.send(file=transcript)
+        else:
+            await logs_channel.send(embed=embed_log)
+
     """ Tickets commands. """
 
     @app_commands.command(name="close")
@@ -166,6 +440,8 @@ class Tickets(commands.Cog):
 
         await interaction.response.send_message("This ticket will soon be closed.")
 
+        # Nobody can write in the ticket anymore, it is kept until its transcript
+        # has been made.
         overwrites = {
             interaction.guild.default_role: discord.PermissionOverwrite(
                 read_messages=False
@@ -173,68 +449,19 @@ class Tickets(commands.Cog):
         }
         await interaction.channel.edit(overwrites=overwrites)
 
-        guild_data = await self.client.mongo.fetch_guild_data()
-
-        user_id = None
-        category = None
-        for ticket_category, tickets in guild_data["tickets"].items():
-            for usr_id, channel_id in tickets.items():
-                if channel_id == interaction.channel.id:
-                    user_id = int(usr_id)
-                    category = ticket_category
-                    break
-
-            if user_id is not None:
-                break
-
-        if user_id is None:
-            # Why are we here. Shouldn't be possible.
+        ticket = await self.client.mongo.delete_ticket(interaction.channel.id)
+        if ticket is None:
+            # Why are we here. Shouldn't be possible, unless it was closed twice.
             return
 
-        try:
-            await self.client.mongo.update_guild_data_document(
-                {"$unset": {f"tickets.{category}.{user_id}": ""}}
-            )
-        except KeyError:
-            # It's a race condition if we're here.
-            pass
-
-        transcript = None
-        try:
-            raw_transcript = await chat_exporter.export(interaction.channel)
-            transcript = discord.File(
-                io.BytesIO(raw_transcript.encode()),
-                filename=f"transcript-{interaction.channel.id}.html",
-            )
-        except Exception:
-            pass
-
-        await interaction.channel.delete()
-
-        logs_channel = interaction.guild.get_channel(
-            self.client.config["channel_id"]["ticket_logs"]
-        )
-
-        user = interaction.guild.get_member(user_id)
-        user_msg = f"**User**: <@{user}>\n"
-        if user is not None:
-            user_msg = f"**User**: <@{user.id}> / {user.name}#{user.discriminator}\n"
-
-        closer = interaction.user
-        embed_log = discord.Embed(
-            title="Ticket",
-            description=f"{user_msg}"
-            f"**Closed by**: {closer.mention} / {closer.name}#{closer.discriminator}\n"
-            f"**Category**: {category}\n"
-            f"**Transcript**: *see attachments*\n",
-            color=self.client.color,
-            timestamp=discord.utils.utcnow(),
-        )
-
-        if transcript is not None:
-            await logs_channel.send(embed=embed_log, file=transcript)
-        else:
-            await logs_channel.send(embed=embed_log)
+        transcript_job = {
+            "_id": interaction.channel.id,
+            "user_id": ticket["user_id"],
+            "category": ticket["category"],
+            "closer_id": interaction.user.id,
+        }
+        await self.client.mongo.insert_transcript_job(transcript_job)
+        self.transcript_queue.put_nowait(transcript_job)
 
 
 async def setup(client):
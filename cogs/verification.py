@@ -1,14 +1,30 @@
 import asyncio
+import collections
 import datetime
+import logging
 import random
 import string
-from typing import Optional
+from typing import Dict, List, Literal, Optional, Set, Tuple
 
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 from discord_bot_owners import DiscordBotOwners
+from metrics import timed_callback
+from pagination import PageCache, PaginatedView
+from throttle import Throttle, throttled_callback, throttled_command
+
+log = logging.getLogger(__name__)
+
+# The verification buttons are answered from memory, their global caps only guard
+# the database while the verification states are loading.
+BOT_OWNER_THROTTLE = Throttle("bot_owner", rate=3, per=30, global_rate=50, global_per=1)
+LIBRARY_DEVELOPER_THROTTLE = Throttle(
+    "library_developer", rate=3, per=30, global_rate=50, global_per=1
+)
+CODES_THROTTLE = Throttle("codes", rate=3, per=30, global_rate=10, global_per=1)
+TEAM_VIEW_THROTTLE = Throttle("team_view", rate=3, per=10, global_rate=20, global_per=1)
 
 """ Verification views. """
 
@@ -20,8 +36,9 @@ async def accept_verification(
         member.id,
         {"$set": {"verification_pending": False, "verification_cooldown": None}},
     )
-    await interaction.client.mongo.update_guild_data_document(
-        {"$unset": {f"pending_verification_message_ids.{message.id}": ""}}
+    await interaction.client.mongo.delete_pending_verification(message.id)
+    interaction.client.get_cog("Verification").set_verification_state(
+        member.id, False, None
     )
 
     embed = message.embeds[0]
@@ -34,15 +51,21 @@ async def accept_verification(
         f"You accepted the verification for {member.mention}.", ephemeral=True
     )
 
-    general_channel = interaction.guild.get_channel(
-        interaction.client.config["channel_id"]["general"]
+    await send_accepted_messages(interaction.client, member)
+
+
+async def send_accepted_messages(
+    client: DiscordBotOwners, member: discord.Member
+) -> None:
+    general_channel = member.guild.get_channel(client.config["channel_id"]["general"])
+    await client.outbox.send(
+        general_channel, f"Welcome {member.mention} to Discord Bot Owners!"
     )
-    await general_channel.send(f"Welcome {member.mention} to Discord Bot Owners!")
 
     accepted_embed = discord.Embed(
         title="Verification Accepted",
         description="Your verification to enter Discord Bot Owners has been accepted.",
-        color=interaction.client.color,
+        color=client.color,
         timestamp=discord.utils.utcnow(),
     )
 
@@ -52,18 +75,35 @@ async def accept_verification(
         pass
 
 
-async def is_on_cooldown(interaction: discord.Interaction) -> bool:
-    guild_member = await interaction.client.mongo.fetch_guild_member(
-        interaction.user.id
+async def send_denied_message(
+    client: DiscordBotOwners, member: discord.Member, reason: str
+) -> None:
+    denied_embed = discord.Embed(
+        title="Verification Denied",
+        description="Your verification to enter Discord Bot Owners has been denied.",
+        color=client.color,
+        timestamp=discord.utils.utcnow(),
     )
-    if guild_member["verification_pending"] is True:
+
+    denied_embed.add_field(name="Reason", value=reason)
+
+    try:
+        await member.send(embed=denied_embed)
+    except discord.HTTPException:
+        pass
+
+
+async def is_on_cooldown(interaction: discord.Interaction) -> bool:
+    pending, cooldown = await interaction.client.get_cog(
+        "Verification"
+    ).fetch_verification_state(interaction.user.id)
+    if pending is True:
         await interaction.response.send_message(
             "Your verification request is already pending.", ephemeral=True
         )
         return True
 
     now = datetime.datetime.now()
-    cooldown = guild_member["verification_cooldown"]
     if cooldown is not None and cooldown > now:
         remaining = discord.utils.format_dt(cooldown, "R")
         await interaction.response.send_message(
@@ -90,12 +130,11 @@ async def apply_verification_submit_actions(
         interaction.user.id,
         {"$set": {"verification_pending": True, "verification_cooldown": cooldown}},
     )
-    await interaction.client.mongo.update_guild_data_document(
-        {
-            "$set": {
-                f"pending_verification_message_ids.{pending_verification_message_id.id}": interaction.user.id
-            }
-        }
+    interaction.client.get_cog("Verification").set_verification_state(
+        interaction.user.id, True, cooldown
+    )
+    await interaction.client.mongo.insert_pending_verification(
+        pending_verification_message_id.id, interaction.user.id
     )
 
     confirmation_message = (
@@ -133,9 +172,12 @@ class AcceptedBotOwnerVerificationSelect(discord.ui.Select):
             interaction.client.config["role_id"]["verified_member"]
         )
 
-        await self.member.add_roles(role, verified_bot_developer_role, verified_member)
+        role_change = interaction.client.role_queue.edit_roles(
+            self.member, add=[role, verified_bot_developer_role, verified_member]
+        )
 
         await accept_verification(interaction, self.member, self.message)
+        await role_change
 
 
 class DeniedBotOwnerVerificationModal(discord.ui.Modal, title="Deny Verification"):
@@ -148,6 +190,14 @@ class DeniedBotOwnerVerificationModal(discord.ui.Modal, title="Deny Verification
     )
 
     async def on_submit(self, interaction: discord.Interaction):
+        user_id = await interaction.client.mongo.fetch_pending_verification(
+            self.message.id
+        )
+        if user_id is None:
+            return await interaction.response.send_message(
+                "This verification request has already been handled.", ephemeral=True
+            )
+
         embed = self.message.embeds[0]
 
         embed.set_field_at(len(embed.fields) - 1, name="Status", value="Denied.")
@@ -155,20 +205,16 @@ class DeniedBotOwnerVerificationModal(discord.ui.Modal, title="Deny Verification
         embed.colour = interaction.client.red
         await self.message.edit(embed=embed, view=None)
 
-        guild_data = await interaction.client.mongo.fetch_guild_data()
-
-        user_id = guild_data["pending_verification_message_ids"][str(self.message.id)]
-        member = interaction.guild.get_member(user_id)
+        member = await interaction.client.get_or_fetch_member(
+            interaction.guild, user_id
+        )
 
         await interaction.client.mongo.update_guild_member_document(
             user_id, {"$set": {"verification_pending": False}}
         )
-        await interaction.client.mongo.update_guild_data_document(
-            {
-                "$unset": {
-                    f"pending_verification_message_ids.{interaction.message.id}": ""
-                }
-            }
+        await interaction.client.mongo.delete_pending_verification(self.message.id)
+        interaction.client.get_cog("Verification").set_verification_state(
+            user_id, False
         )
 
         await interaction.response.send_message(
@@ -176,19 +222,7 @@ class DeniedBotOwnerVerificationModal(discord.ui.Modal, title="Deny Verification
         )
 
         if member is not None:
-            denied_embed = discord.Embed(
-                title="Verification Denied",
-                description="Your verification to enter Discord Bot Owners has been denied.",
-                color=interaction.client.color,
-                timestamp=discord.utils.utcnow(),
-            )
-
-            denied_embed.add_field(name="Reason", value=self.reason.value)
-
-            try:
-                await member.send(embed=denied_embed)
-            except discord.HTTPException:
-                pass
+            await send_denied_message(interaction.client, member, self.reason.value)
 
 
 class PendingVerificationView(discord.ui.View):
@@ -198,15 +232,21 @@ class PendingVerificationView(discord.ui.View):
     @discord.ui.button(
         label="Accept", style=discord.ButtonStyle.green, custom_id="persisten:accept"
     )
+    @timed_callback
     async def accept(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ) -> None:
-        guild_data = await interaction.client.mongo.fetch_guild_data()
+        user_id = await interaction.client.mongo.fetch_pending_verification(
+            interaction.message.id
+        )
+        if user_id is None:
+            return await interaction.response.send_message(
+                "This verification request has already been handled.", ephemeral=True
+            )
 
-        user_id = guild_data["pending_verification_message_ids"][
-            str(interaction.message.id)
-        ]
-        member = interaction.guild.get_member(user_id)
+        member = await interaction.client.get_or_fetch_member(
+            interaction.guild, user_id
+        )
 
         embed = interaction.message.embeds[0]
 
@@ -214,7 +254,13 @@ class PendingVerificationView(discord.ui.View):
             embed.set_field_at(len(embed.fields) - 1, name="Status", value="User left.")
             await interaction.message.edit(embed=embed, view=None)
             await interaction.client.mongo.update_guild_member_document(
-                member.id, {"$set": {"verification_pending": False}}
+                user_id, {"$set": {"verification_pending": False}}
+            )
+            await interaction.client.mongo.delete_pending_verification(
+                interaction.message.id
+            )
+            interaction.client.get_cog("Verification").set_verification_state(
+                user_id, False
             )
             return await interaction.response.send_message(
                 "The user left the server.", ephemeral=True
@@ -236,13 +282,17 @@ class PendingVerificationView(discord.ui.View):
                 interaction.client.config["role_id"]["verified_member"]
             )
 
-            await member.add_roles(library_developer, verified_member)
+            role_change = interaction.client.role_queue.edit_roles(
+                member, add=[library_developer, verified_member]
+            )
 
             await accept_verification(interaction, member, interaction.message)
+            await role_change
 
     @discord.ui.button(
         label="Deny", style=discord.ButtonStyle.red, custom_id="persisten:deny"
     )
+    @timed_callback
     async def deny(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ) -> None:
@@ -368,47 +418,38 @@ class LibraryDeveloperModal(discord.ui.Modal, title="Apply as a Library Develope
 
 
 class BotTeamModal(discord.ui.Modal, title="Apply as a Bot Team Member"):
-    generator_user_id = discord.ui.TextInput(
-        label="Code Owner's ID",
-        style=discord.TextStyle.short,
-        placeholder="The ID of the user who gave you the code.",
-    )
-
     code = discord.ui.TextInput(label="Code", style=discord.TextStyle.short)
 
     async def on_submit(self, interaction: discord.Interaction) -> None:
-        try:
-            user_id = int(self.generator_user_id.value)
-        except ValueError:
-            return await interaction.response.send_message(
-                "You must input a valid user ID.", ephemeral=True
-            )
-
-        guild_member = await interaction.client.mongo.fetch_guild_member(user_id)
+        # The code is claimed in a single write, so it can't be used twice.
+        verification_code = await interaction.client.mongo.redeem_verification_code(
+            self.code.value, interaction.user.id
+        )
+        if verification_code is None:
+            if (
+                await interaction.client.mongo.fetch_verification_code(self.code.value)
+                is not None
+            ):
+                return await interaction.response.send_message(
+                    "The code you have entered has already been used.", ephemeral=True
+                )
 
-        if self.code.value not in guild_member["verification_codes"]:
             return await interaction.response.send_message(
                 "You have entered an invalid code.", ephemeral=True
             )
 
-        if guild_member["verification_codes"][self.code.value] is not None:
-            return await interaction.response.send_message(
-                "The code you have entered has already been used.", ephemeral=True
-            )
-
         await interaction.client.mongo.update_guild_member_document(
             interaction.user.id,
             {
                 "$set": {
                     "verification_join_code": self.code.value,
-                    "verification_join_inviter": user_id,
+                    "verification_join_inviter": verification_code["owner_id"],
                 }
             },
         )
-        await interaction.client.mongo.update_guild_member_document(
-            user_id,
-            {"$set": {f"verification_codes.{self.code.value}": interaction.user.id}},
-        )
+        verification = interaction.client.get_cog("Verification")
+        verification.code_joined_member_ids.add(interaction.user.id)
+        verification.invalidate_team(verification_code["owner_id"])
 
         bot_team_role = interaction.guild.get_role(
             interaction.client.config["role_id"]["bot_team_member"]
@@ -422,7 +463,9 @@ class BotTeamModal(discord.ui.Modal, title="Apply as a Bot Team Member"):
             ephemeral=True,
         )
 
-        await interaction.user.add_roles(bot_team_role, verified_member)
+        await interaction.client.role_queue.edit_roles(
+            interaction.user, add=[bot_team_role, verified_member]
+        )
 
 
 class VerificationView(discord.ui.View):
@@ -434,6 +477,8 @@ class VerificationView(discord.ui.View):
         style=discord.ButtonStyle.blurple,
         custom_id="persisten:bot_owner",
     )
+    @timed_callback
+    @throttled_callback(BOT_OWNER_THROTTLE)
     async def bot_owner(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ) -> None:
@@ -447,6 +492,8 @@ class VerificationView(discord.ui.View):
         style=discord.ButtonStyle.blurple,
         custom_id="persisten:lib_dev",
     )
+    @timed_callback
+    @throttled_callback(LIBRARY_DEVELOPER_THROTTLE)
     async def library_developer(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ) -> None:
@@ -460,20 +507,111 @@ class VerificationView(discord.ui.View):
         style=discord.ButtonStyle.blurple,
         custom_id="persisten:bot_team",
     )
+    @timed_callback
     async def bot_team(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ) -> None:
         await interaction.response.send_modal(BotTeamModal())
 
 
+class TeamView(PaginatedView):
+    def __init__(
+        self,
+        cog: "Verification",
+        author_id: int,
+        owner: discord.Member,
+        member_ids: List[int],
+    ):
+        super().__init__(
+            author_id,
+            member_ids,
+            cog.TEAM_PAGE_SIZE,
+            lambda cursor, page: cog.fetch_team_page(owner.id, cursor),
+            lambda member_id: member_id,
+        )
+        self.cog = cog
+        self.owner = owner
+
+    def build_embed(self) -> discord.Embed:
+        invited_members = "".join(f"- <@{member_id}>\n" for member_id in self.entries)
+
+        team_view_embed = discord.Embed(
+            title="Team View",
+            description=f"The following users are part of {self.owner.mention}'s team:\n\n"
+            f"{invited_members}",
+            color=self.cog.client.color,
+            timestamp=discord.utils.utcnow(),
+        )
+        team_view_embed.set_footer(text=f"Page {self.page + 1}")
+
+        return team_view_embed
+
+
+class TeamDisbandView(discord.ui.View):
+    def __init__(self, cog: "Verification", owner: discord.Member):
+        super().__init__(timeout=60)
+        self.cog = cog
+        self.owner = owner
+
+    @discord.ui.button(label="Remove my whole team", style=discord.ButtonStyle.red)
+    async def confirm(
+        self, interaction: discord.Interaction, button: discord.ui.Button
+    ) -> None:
+        self.stop()
+        await interaction.response.edit_message(
+            content="Your team is being removed...", view=None
+        )
+
+        kicked_count, failed_count = await self.cog.remove_team(self.owner)
+
+        result = f"You have successfully removed {kicked_count} members from your team."
+        if failed_count > 0:
+            result += f" {failed_count} members couldn't be removed."
+        await interaction.edit_original_response(content=result)
+
+    @discord.ui.button(label="Cancel", style=discord.ButtonStyle.grey)
+    async def cancel(
+        self, interaction: discord.Interaction, button: discord.ui.Button
+    ) -> None:
+        self.stop()
+        await interaction.response.edit_message(
+            content="Your team has not been removed.", view=None
+        )
+
+
 class Verification(commands.Cog):
     """The cog to manage the verification system."""
 
+    # The verification buttons are answered from memory, the expired cooldowns are
+    # evicted periodically.
+    COOLDOWN_EVICTION_INTERVAL = 600
+
     def __init__(self, client: DiscordBotOwners):
         self.client = client
 
+        self.verification_pending: Set[int] = set()
+        self.verification_cooldowns: Dict[int, datetime.datetime] = {}
+        self._verification_states_loaded = False
+        self._verification_state_changes: Optional[List[tuple]] = None
+
+        # Only the members who joined with a code have to be handled when they leave.
+        self.code_joined_member_ids: Set[int] = set()
+        self._code_joined_member_ids_loaded = False
+
+        self._team_cache = PageCache(self.TEAM_CACHE_TTL)
+
     async def cog_load(self) -> None:
-        self.client.loop.create_task(self.after_ready())
+        self.client.add_ready_task("view rehydration verification", self.after_ready)
+        # Until they are loaded, the indexes are answered from the database. They
+        # are loaded apart from the views so the buttons work even if they fail.
+        self.client.add_ready_task("verification states", self.load_verification_states)
+        self.client.add_ready_task(
+            "code joined members", self.load_code_joined_member_ids
+        )
+        self.evict_verification_cooldowns.start()
+
+    async def cog_unload(self) -> None:
+        self.evict_verification_cooldowns.cancel()
 
     async def after_ready(self) -> None:
         await self.client.wait_until_ready()
@@ -486,8 +624,92 @@ class Verification(commands.Cog):
             VerificationView(), message_id=guild_data["verification_message_id"]
         )
 
-        for message_id in guild_data["pending_verification_message_ids"].keys():
-            self.client.add_view(PendingVerificationView(), message_id=int(message_id))
+        for (
+            pending_verification
+        ) in await self.client.mongo.fetch_pending_verifications():
+            self.client.add_view(
+                PendingVerificationView(), message_id=pending_verification["_id"]
+            )
+
+    async def load_code_joined_member_ids(self) -> None:
+        # Merged with the members who redeemed a code while it was loading.
+        self.code_joined_member_ids |= (
+            await self.client.mongo.fetch_code_joined_member_ids()
+        )
+        self._code_joined_member_ids_loaded = True
+
+    """ Verification states. """
+
+    async def load_verification_states(self) -> None:
+        # The states set while loading are newer than the loaded ones, they are set
+        # again once loaded.
+        self._verification_state_changes = []
+        try:
+            guild_members = await self.client.mongo.fetch_verification_states()
+        finally:
+            changes, self._verification_state_changes = (
+                self._verification_state_changes,
+                None,
+            )
+
+        verification_pending = set()
+        verification_cooldowns = {}
+        for guild_member in guild_members:
+            if guild_member.get("verification_pending") is True:
+                verification_pending.add(guild_member["_id"])
+            if guild_member.get("verification_cooldown") is not None:
+                verification_cooldowns[guild_member["_id"]] = guild_member[
+                    "verification_cooldown"
+                ]
+
+        self.verification_pending = verification_pending
+        self.verification_cooldowns = verification_cooldowns
+        for change in changes:
+            self.set_verification_state(*change)
+
+        self._verification_states_loaded = True
+
+    async def fetch_verification_state(
+        self, member_id: int
+    ) -> Tuple[bool, Optional[datetime.datetime]]:
+        """Whether a member has a pending verification, and their cooldown."""
+        if not self._verification_states_loaded:
+            guild_member = await self.client.mongo.fetch_guild_member(member_id)
+            return (
+                guild_member["verification_pending"],
+                guild_member["verification_cooldown"],
+            )
+
+        return (
+            member_id in self.verification_pending,
+            self.verification_cooldowns.get(member_id),
+        )
+
+    def set_verification_state(
+        self, member_id: int, pending: bool, cooldown=discord.utils.MISSING
+    ) -> None:
+        """Keep the states in memory in sync with a write to the database."""
+        if self._verification_state_changes is not None:
+            self._verification_state_changes.append((member_id, pending, cooldown))
+
+        if pending:
+            self.verification_pending.add(member_id)
+        else:
+            self.verification_pending.discard(member_id)
+
+        if cooldown is None:
+            self.verification_cooldowns.pop(member_id, None)
+        elif cooldown is not discord.utils.MISSING:
+            self.verification_cooldowns[member_id] = cooldown
+
+    @tasks.loop(seconds=COOLDOWN_EVICTION_INTERVAL)
+    async def evict_verification_cooldowns(self) -> None:
+        now = datetime.datetime.now()
+        self.verification_cooldowns = {
+            member_id: cooldown
+            for member_id, cooldown in self.verification_cooldowns.items()
+            if cooldown > now
+        }
 
     async def send_verification_view(self, channel, **kwargs) -> None:
         verification_embed = discord.Embed(
@@ -511,9 +733,240 @@ class Verification(commands.Cog):
         )
         await self.client.reload_extension("cogs.verification")
 
+    """ Bulk review. """
+
+    # Each review makes a few API calls, only some of them run at the same time so
+    # the rate limits are not hit.
+    BULK_REVIEW_CONCURRENCY = 5
+    BULK_REVIEW_PROGRESS_INTERVAL = 10
+
+    async def _review_request(
+        self,
+        message: discord.Message,
+        user_id: int,
+        decision: str,
+        role: Optional[discord.Role],
+        reason: Optional[str],
+    ) -> str:
+        member = await self.client.get_or_fetch_member(message.guild, user_id)
+
+        embed = message.embeds[0]
+
+        if member is None:
+            embed.set_field_at(len(embed.fields) - 1, name="Status", value="User left.")
+            await message.edit(embed=embed, view=None)
+            return "left"
+
+        if decision == "deny":
+            embed.set_field_at(len(embed.fields) - 1, name="Status", value="Denied.")
+            embed.add_field(name="Reason", value=reason)
+            embed.colour = self.client.red
+            await message.edit(embed=embed, view=None)
+
+            await send_denied_message(self.client, member, reason)
+            return "denied"
+
+        roles = [
+            message.guild.get_role(self.client.config["role_id"]["verified_member"])
+        ]
+        if len(embed.fields) == 5:
+            roles.append(role)
+            roles.append(
+                message.guild.get_role(
+                    self.client.config["role_id"]["verified_bot_developer"]
+                )
+            )
+        else:
+            roles.append(
+                message.guild.get_role(
+                    self.client.config["role_id"]["library_developer"]
+                )
+            )
+
+        role_change = self.client.role_queue.edit_roles(member, add=roles)
+
+        embed.set_field_at(len(embed.fields) - 1, name="Status", value="Accepted.")
+        embed.colour = self.client.green
+        await message.edit(embed=embed, view=None)
+
+        await send_accepted_messages(self.client, member)
+        await role_change
+        return "accepted"
+
+    @app_commands.command(name="review")
+    @app_commands.default_permissions()
+    async def review(
+        self,
+        interaction: discord.Interaction,
+        decision: Literal["accept", "deny"],
+        amount: int,
+        role: Optional[discord.Role] = None,
+        reason: Optional[str] = None,
+    ):
+        """Accept or deny the oldest pending verification requests in bulk."""
+        if amount < 1 or amount > 500:
+            return await interaction.response.send_message(
+                "You can only review a maximum amount of 500 requests.", ephemeral=True
+            )
+
+        if (
+            role is not None
+            and str(role.id) not in self.client.config["role_id"]["bot_owner_roles"]
+        ):
+            return await interaction.response.send_message(
+                "The role must be one of the bot owner roles.", ephemeral=True
+            )
+
+        if decision == "deny" and (reason is None or len(reason) > 1024):
+            return await interaction.response.send_message(
+                "You must give a reason of at most 1024 characters to deny requests.",
+                ephemeral=True,
+            )
+
+        await interaction.response.defer(ephemeral=True)
+
+        pending_verifications = sorted(
+            await self.client.mongo.fetch_pending_verifications(),
+            key=lambda pending_verification: pending_verification["_id"],
+        )
+
+        verification_requests_channel = interaction.guild.get_channel(
+            self.client.config["channel_id"]["verification_requests"]
+        )
+        semaphore = asyncio.Semaphore(self.BULK_REVIEW_CONCURRENCY)
+
+        async def fetch_message(message_id: int) -> Optional[discord.Message]:
+            async with semaphore:
+                try:
+                    return await verification_requests_channel.fetch_message(message_id)
+                except discord.NotFound:
+                    return None
+
+        # Bot owner requests can only be accepted with the role to give them.
+        outcomes = collections.Counter()
+        requests = []
+        index = 0
+        while len(requests) < amount and index < len(pending_verifications):
+            chunk = pending_verifications[index : index + amount - len(requests)]
+            index += len(chunk)
+
+            messages = await asyncio.gather(
+                *(
+                    fetch_message(pending_verification["_id"])
+                    for pending_verification in chunk
+                )
+            )
+            for pending_verification, message in zip(chunk, messages):
+                if (
+                    message is not None
+                    and decision == "accept"
+                    and role is None
+                    and len(message.embeds[0].fields) == 5
+                ):
+                    outcomes["skipped"] += 1
+                    continue
+
+                requests.append((pending_verification, message))
+
+        if len(requests) == 0:
+            return await interaction.followup.send(
+                "There is no pending verification request to review.", ephemeral=True
+            )
+
+        # The requests are marked as handled before anything is sent, so they can't
+        # be handled twice.
+        member_update = {"$set": {"verification_pending": False}}
+        if decision == "accept":
+            member_update["$set"]["verification_cooldown"] = None
+
+        await self.client.mongo.delete_pending_verifications(
+            [pending_verification["_id"] for pending_verification, _ in requests]
+        )
+        await self.client.mongo.update_guild_member_documents(
+            {
+                pending_verification["user_id"]: member_update
+                for pending_verification, _ in requests
+            }
+        )
+        for pending_verification, _ in requests:
+            if decision == "accept":
+                self.set_verification_state(
+                    pending_verification["user_id"], False, None
+                )
+            else:
+                self.set_verification_state(pending_verification["user_id"], False)
+
+        progress_message = None
+        if len(requests) > self.BULK_REVIEW_PROGRESS_INTERVAL:
+            progress_message = await interaction.followup.send(
+                f"Reviewing {len(requests)} requests...", ephemeral=True, wait=True
+            )
+
+        reviewed_count = 0
+
+        async def review_request(pending_verification: dict, message) -> None:
+            nonlocal reviewed_count
+
+            async with semaphore:
+                if message is None:
+                    outcome = "missing"
+                else:
+                    try:
+                        outcome = await self._review_request(
+                            message,
+                            pending_verification["user_id"],
+                            decision,
+                            role,
+                            reason,
+                        )
+                    except Exception:
+                        log.exception(
+                            "Failed to review the verification request %s.",
+                            pending_verification["_id"],
+                        )
+                        outcome = "failed"
+
+            outcomes[outcome] += 1
+            reviewed_count += 1
+            if (
+                progress_message is not None
+                and reviewed_count % self.BULK_REVIEW_PROGRESS_INTERVAL == 0
+            ):
+                await progress_message.edit(
+                    content=f"Reviewing {len(requests)} requests... "
+                    f"({reviewed_count}/{len(requests)})"
+                )
+
+        await asyncio.gather(
+            *(
+                review_request(pending_verification, message)
+                for pending_verification, message in requests
+            )
+        )
+
+        summary = (
+            f"You reviewed {len(requests)} verification requests:\n"
+            f"- **Accepted**: {outcomes['accepted']}\n"
+            f"- **Denied**: {outcomes['denied']}\n"
+            f"- **User left**: {outcomes['left']}\n"
+            f"- **Message deleted**: {outcomes['missing']}\n"
+            f"- **Failed**: {outcomes['failed']}\n"
+        )
+        if outcomes["skipped"] > 0:
+            summary += (
+                f"\n{outcomes['skipped']} bot owner requests were skipped, "
+                f"a role is needed to accept them."
+            )
+
+        if progress_message is not None:
+            await progress_message.edit(content=summary)
+        else:
+            await interaction.followup.send(summary, ephemeral=True)
+
     """ Verification with code commands. """
 
     @app_commands.command(name="codes")
+    @throttled_command(CODES_THROTTLE)
     async def codes(self, interaction: discord.Interaction):
         """Show the codes you own to invite members from your bot team."""
         if (
@@ -526,7 +979,9 @@ class Verification(commands.Cog):
                 "You must be a verified bot owner to use this command.", ephemeral=True
             )
 
-        guild_member = await self.client.mongo.fetch_guild_member(interaction.user.id)
+        verification_codes = await self.client.mongo.fetch_verification_codes(
+            interaction.user.id
+        )
 
         total_codes = 0
         for role in interaction.user.roles:
@@ -535,25 +990,39 @@ class Verification(commands.Cog):
             )
             total_codes += role_codes
 
-        if len(guild_member["verification_codes"]) < total_codes:
-            new_codes = total_codes - len(guild_member["verification_codes"])
-            for x in range(new_codes):
-                characters = string.ascii_letters + string.digits
-                code = "".join(random.choice(characters) for _ in range(6))
-                guild_member["verification_codes"][code] = None
+        if len(verification_codes) < total_codes:
+            characters = string.ascii_letters + string.digits
+            new_codes = [
+                "".join(random.choice(characters) for _ in range(6))
+                for _ in range(total_codes - len(verification_codes))
+            ]
 
-            await self.client.mongo.update_guild_member_document(
-                interaction.user.id,
-                {"$set": {"verification_codes": guild_member["verification_codes"]}},
+            inserted_count = await self.client.mongo.insert_verification_codes(
+                interaction.user.id, new_codes
             )
+            if inserted_count == len(new_codes):
+                verification_codes += [
+                    {"_id": code, "owner_id": interaction.user.id, "user_id": None}
+                    for code in new_codes
+                ]
+            else:
+                # Some codes were already taken, the others are shown.
+                verification_codes = await self.client.mongo.fetch_verification_codes(
+                    interaction.user.id
+                )
 
         description = ""
-        for code, user_id in guild_member["verification_codes"].items():
-            member = interaction.guild.get_member(user_id)
+        for verification_code in verification_codes:
+            member = None
+            if verification_code["user_id"] is not None:
+                member = await self.client.get_or_fetch_member(
+                    interaction.guild, verification_code["user_id"]
+                )
+
             member_formatted = "Unused"
             if member is not None:
                 member_formatted = f"{member.mention} ({member})"
-            description += f"`{code}` - {member_formatted}\n"
+            description += f"`{verification_code['_id']}` - {member_formatted}\n"
 
         if len(description) == 0:
             description = (
@@ -578,11 +1047,52 @@ class Verification(commands.Cog):
         name="team", description="Manage your team on the server."
     )
 
+    TEAM_PAGE_SIZE = 20
+    TEAM_CACHE_TTL = 60
+
+    # Kicks are rate limited, only some of them are made at the same time.
+    TEAM_REMOVE_CONCURRENCY = 5
+
+    async def fetch_team_page(self, owner_id: int, cursor: Optional[int]) -> List[int]:
+        return await self._team_cache.fetch(
+            (owner_id, cursor),
+            lambda: self.client.mongo.fetch_team_member_ids(
+                owner_id, cursor, self.TEAM_PAGE_SIZE
+            ),
+        )
+
+    def invalidate_team(self, owner_id: int) -> None:
+        self._team_cache.invalidate(lambda key: key[0] == owner_id)
+
+    async def remove_team(self, owner: discord.Member) -> Tuple[int, int]:
+        """Kick every member of a bot owner's team, returning the kicked and failed."""
+        member_ids = await self.client.mongo.fetch_team_member_ids(owner.id)
+        semaphore = asyncio.Semaphore(self.TEAM_REMOVE_CONCURRENCY)
+        reason = f"Removed by {owner} ({owner.id}), with their whole bot team."
+
+        async def kick(member_id: int) -> bool:
+            async with semaphore:
+                member = await self.client.get_or_fetch_member(owner.guild, member_id)
+                if member is None:
+                    return False
+
+                try:
+                    await member.kick(reason=reason)
+                except discord.HTTPException:
+                    return False
+
+                return True
+
+        kicked = await asyncio.gather(*(kick(member_id) for member_id in member_ids))
+        self.invalidate_team(owner.id)
+
+        return sum(kicked), len(kicked) - sum(kicked)
+
     @team_group.command(name="remove")
     async def team_remove(self, interaction: discord.Interaction, user: discord.Member):
         """Remove a member of your bot team from this server."""
-        guild_member = await self.client.mongo.fetch_guild_member(interaction.user.id)
-        if user.id not in guild_member["verification_codes"].values():
+        guild_member = await self.client.mongo.fetch_guild_member(user.id)
+        if guild_member["verification_join_inviter"] != interaction.user.id:
             return await interaction.response.send_message(
                 "You did not invite this user.", ephemeral=True
             )
@@ -595,7 +1105,24 @@ class Verification(commands.Cog):
             ephemeral=True,
         )
 
+    @team_group.command(name="disband")
+    async def team_disband(self, interaction: discord.Interaction):
+        """Remove every member of your bot team from this server."""
+        member_ids = await self.fetch_team_page(interaction.user.id, None)
+        if len(member_ids) == 0:
+            return await interaction.response.send_message(
+                "You have not invited anyone from your team to this server.",
+                ephemeral=True,
+            )
+
+        await interaction.response.send_message(
+            "Are you sure you want to remove every member of your team from this server?",
+            view=TeamDisbandView(self, interaction.user),
+            ephemeral=True,
+        )
+
     @team_group.command(name="view")
+    @throttled_command(TEAM_VIEW_THROTTLE)
     async def team_view(
         self, interaction: discord.Interaction, user: Optional[discord.Member]
     ):
@@ -611,35 +1138,28 @@ class Verification(commands.Cog):
                 "The user you provided is not a verified bot owner.", ephemeral=True
             )
 
-        guild_member = await self.client.mongo.fetch_guild_member(user.id)
-
-        invited_members = ""
-        for code, user_id in guild_member["verification_codes"].items():
-            if user_id is None:
-                continue
-
-            team_member = interaction.guild.get_member(user_id)
-            invited_members += f"- {team_member.mention}\n"
-
-        if len(invited_members) == 0:
+        member_ids = await self.fetch_team_page(user.id, None)
+        if len(member_ids) == 0:
             return await interaction.response.send_message(
                 "This member has not invited anyone from their team to this server."
             )
 
-        team_view_embed = discord.Embed(
-            title="Team View",
-            description=f"The following users are part of {user.mention}'s team:\n\n"
-            f"{invited_members}",
-            color=self.client.color,
-            timestamp=discord.utils.utcnow(),
-        )
-
-        await interaction.response.send_message(embed=team_view_embed)
+        view = TeamView(self, interaction.user.id, user, member_ids)
+        await interaction.response.send_message(embed=view.build_embed(), view=view)
 
     """ Invited member remove handling. """
 
     @commands.Cog.listener()
-    async def on_member_remove(self, member: discord.Member):
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        # The raw event is used as members who left might not be cached.
+        member = payload.user
+
+        if (
+            self._code_joined_member_ids_loaded
+            and member.id not in self.code_joined_member_ids
+        ):
+            return
+
         guild_member = await self.client.mongo.fetch_guild_member(member.id)
         if guild_member["verification_join_code"] is None:
             return
@@ -656,9 +1176,9 @@ class Verification(commands.Cog):
                 }
             },
         )
-        await self.client.mongo.update_guild_member_document(
-            inviter_id, {"$unset": {f"verification_codes.{code}": ""}}
-        )
+        await self.client.mongo.delete_verification_code(code)
+        self.invalidate_team(inviter_id)
+        self.code_joined_member_ids.discard(member.id)
 
 
 async def setup(client):
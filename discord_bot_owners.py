@@ -1,31 +1,98 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import functools
+import hashlib
 import json
+import logging
 import os
-from typing import Optional, TYPE_CHECKING
+import time
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Union,
+    TYPE_CHECKING,
+)
 
 import aiohttp
 import discord
+from discord import app_commands
 from discord.ext import commands
 
+from metrics import Metrics, interaction_latency
+from throttle import Rejection, Throttled
+
 if TYPE_CHECKING:
+    from cogs.loop_monitor import LoopMonitor
     from cogs.mongodb import MongoDB
+    from cogs.outbox import Outbox
+    from cogs.role_queue import RoleQueue
 
 os.environ["JISHAKU_HIDE"] = "true"
 
+log = logging.getLogger(__name__)
+
+config_load_start = time.perf_counter()
 with open("config.json", "r") as fic:
     config = dict(json.load(fic))
+config_load_time = time.perf_counter() - config_load_start
+
+
+class CommandTree(app_commands.CommandTree):
+    async def on_error(
+        self, interaction: discord.Interaction, error: app_commands.AppCommandError
+    ) -> None:
+        throttled = isinstance(error, app_commands.CommandOnCooldown)
+
+        if interaction.command is not None:
+            interaction.client.metrics.observe(
+                "discord_app_command_latency_seconds",
+                interaction_latency(interaction),
+                command=interaction.command.qualified_name,
+                status="throttled" if throttled else "error",
+            )
+
+        if throttled:
+            rejection = (
+                error.rejection
+                if isinstance(error, Throttled)
+                else Rejection("user", error.retry_after)
+            )
+            return await interaction.response.send_message(
+                rejection.message, ephemeral=True
+            )
+
+        await super().on_error(interaction, error)
 
 
 class DiscordBotOwners(commands.Bot):
     def __init__(self):
+        self.started_at = time.perf_counter()
+
+        # The duration of each startup phase, logged once the bot is ready.
+        self.startup_report: Dict[str, float] = {"config load": config_load_time}
+        self._ready_tasks: Optional[List[asyncio.Task]] = []
+        # The loop only keeps weak references to its tasks.
+        self._background_tasks: Set[asyncio.Task] = set()
+
+        # Lazily chunked members are downloaded in the background once the bot is
+        # ready, so it doesn't have to wait for every member of the guild to start.
+        self.lazy_member_chunking = config.get("lazy_member_chunking", False)
+
         super().__init__(
             command_prefix="!",
             intents=discord.Intents.all(),
-            chunk_guilds_at_startup=True,
+            chunk_guilds_at_startup=not self.lazy_member_chunking,
             case_insensitive=True,
             activity=discord.Game(f"Helping bot developers!"),
             owner_id=212844004889329664,
+            tree_cls=CommandTree,
         )
 
         self.remove_command("help")
@@ -39,41 +106,201 @@ class DiscordBotOwners(commands.Bot):
         self.green = 0x04D277
         self.red = 0xE24C4B
 
+        self.metrics = Metrics()
+        self.metrics.register("discord_gateway_latency_seconds", lambda: self.latency)
+
     @property
     def mongo(self) -> Optional[MongoDB]:
         return self.get_cog("MongoDB")
 
+    @property
+    def outbox(self) -> Optional[Outbox]:
+        return self.get_cog("Outbox")
+
+    @property
+    def role_queue(self) -> Optional[RoleQueue]:
+        return self.get_cog("RoleQueue")
+
+    @property
+    def loop_monitor(self) -> Optional[LoopMonitor]:
+        return self.get_cog("LoopMonitor")
+
+    async def get_or_fetch_member(
+        self, guild: discord.Guild, user_id: int
+    ) -> Optional[discord.Member]:
+        member = guild.get_member(user_id)
+        if member is not None or guild.chunked:
+            return member
+
+        try:
+            return await guild.fetch_member(user_id)
+        except discord.NotFound:
+            return None
+
+    """ Startup report. """
+
+    @contextlib.contextmanager
+    def startup_phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_report[name] = time.perf_counter() - start
+
+    def add_ready_task(self, name: str, func: Callable[[], Awaitable[None]]) -> None:
+        """Run a function once the bot is ready, timing it in the startup report."""
+
+        async def run_timed() -> None:
+            await self.wait_until_ready()
+            with self.startup_phase(name):
+                try:
+                    await func()
+                except Exception:
+                    # Nothing awaits the tasks added once the bot is ready.
+                    log.exception("The ready task %s failed.", name)
+
+        task = self.loop.create_task(run_timed())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        if self._ready_tasks is not None:
+            self._ready_tasks.append(task)
+
+    """ Metrics. """
+
+    async def on_socket_event_type(self, event_type: str) -> None:
+        self.metrics.increment("discord_events_total", event=event_type)
+
+    async def on_app_command_completion(
+        self,
+        interaction: discord.Interaction,
+        command: Union[app_commands.Command, app_commands.ContextMenu],
+    ) -> None:
+        self.metrics.observe(
+            "discord_app_command_latency_seconds",
+            interaction_latency(interaction),
+            command=command.qualified_name,
+            status="success",
+        )
+
     """ Ready actions. """
 
     async def ready_actions(self) -> None:
         await self.wait_until_ready()
 
-        print(f"Ready: {self.user} (ID: {self.user.id}).")
+        time_to_ready = time.perf_counter() - self.started_at
+        self.startup_report["gateway ready"] = time_to_ready
+
+        chunking_mode = "lazy" if self.lazy_member_chunking else "startup"
+        print(
+            f"Ready: {self.user} (ID: {self.user.id}) in "
+            f"{time_to_ready:.2f}s ({chunking_mode} member chunking)."
+        )
+
+        if self.lazy_member_chunking:
+            for guild in self.guilds:
+                if not guild.chunked:
+                    self.add_ready_task(
+                        f"member chunking {guild.id}",
+                        functools.partial(self.chunk_guild, guild),
+                    )
+
+        ready_tasks, self._ready_tasks = self._ready_tasks, None
+        # The failures are logged by the tasks, a cancelled one doesn't stop the report.
+        await asyncio.gather(*ready_tasks, return_exceptions=True)
+
+        log.info(
+            "Startup report: %s",
+            json.dumps(
+                {
+                    phase: round(duration, 3)
+                    for phase, duration in self.startup_report.items()
+                }
+            ),
+        )
+
+    async def chunk_guild(self, guild: discord.Guild) -> None:
+        start = time.perf_counter()
+        await guild.chunk()
+
+        print(
+            f"Chunked {guild.member_count} members of {guild} in "
+            f"{time.perf_counter() - start:.2f}s."
+        )
 
     """ Setup actions. """
 
     async def setup_hook(self) -> None:
         self.loop.create_task(self.ready_actions())
 
-        self.aiosession = aiohttp.ClientSession(loop=self.loop)
-        self.verified_promotions_webhook = discord.Webhook.from_url(
-            self.config["verified_promotions_webhook_url"], session=self.aiosession
+        metrics_port = self.config.get("metrics_port")
+        if metrics_port is not None:
+            await self.metrics.start(
+                self.config.get("metrics_host", "127.0.0.1"), metrics_port
+            )
+
+        with self.startup_phase("session creation"):
+            self.aiosession = aiohttp.ClientSession(loop=self.loop)
+            self.verified_promotions_webhook = discord.Webhook.from_url(
+                self.config["verified_promotions_webhook_url"], session=self.aiosession
+            )
+
+        # The other extensions use the database, the rest are loaded concurrently.
+        await self.load_timed_extension("cogs.mongodb")
+        await asyncio.gather(
+            *(
+                self.load_timed_extension(f"cogs.{filename[:-3]}")
+                for filename in os.listdir("./cogs")
+                if filename.endswith(".py") and filename != "mongodb.py"
+            ),
+            self.load_timed_extension("jishaku"),
         )
 
-        for filename in os.listdir("./cogs"):
-            if filename.endswith(".py"):
-                await self.load_extension(f"cogs.{filename[:-3]}")
+        with self.startup_phase("tree sync"):
+            await self.sync_guild()
 
-        await self.load_extension("jishaku")
+    async def load_timed_extension(self, name: str) -> None:
+        with self.startup_phase(f"extension {name}"):
+            await self.load_extension(name)
 
-        await self.sync_guild()
+    """ Shutdown actions. """
 
-    async def sync_guild(self) -> None:
+    async def close(self) -> None:
+        # Write the buffered exp while the database cog is still loaded.
+        general = self.get_cog("General")
+        if general is not None:
+            await general.flush_exp()
+
+        await self.metrics.stop()
+        await super().close()
+
+    def command_tree_fingerprint(self, guild: discord.abc.Snowflake) -> str:
+        payload = sorted(
+            (
+                command.to_dict(self.tree)
+                for command in self.tree.get_commands(guild=guild)
+            ),
+            key=lambda command: (command["type"], command["name"]),
+        )
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    async def sync_guild(self, force: bool = False) -> bool:
         guild = discord.Object(id=self.config["guild_id"])
         self.tree.copy_global_to(guild=guild)
+
+        # Syncing is slow and rate limited, so it's skipped when no command changed.
+        fingerprint = self.command_tree_fingerprint(guild)
+        guild_data = await self.mongo.fetch_guild_data()
+        if not force and guild_data["command_tree_fingerprint"] == fingerprint:
+            return False
+
         await self.tree.sync(guild=guild)
+        await self.mongo.update_guild_data_document(
+            {"$set": {"command_tree_fingerprint": fingerprint}}
+        )
+
+        return True
 
 
 if __name__ == "__main__":
     bot = DiscordBotOwners()
-    bot.run(config["bot_token"])
+    bot.run(config["bot_token"], root_logger=True)
@@ -0,0 +1,196 @@
+import bisect
+import contextlib
+import functools
+import math
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import discord
+from aiohttp import web
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+# The buckets are finer around the 3 seconds an interaction has to be acknowledged in.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 2.5, 3, 5, 10)
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: LabelSet) -> str:
+    if len(labels) == 0:
+        return ""
+
+    return (
+        "{"
+        + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in labels)
+        + "}"
+    )
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.bucket_counts[index] += 1
+
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """Metrics of the bot, served in the Prometheus text format."""
+
+    def __init__(self):
+        self._histograms: Dict[str, Dict[LabelSet, Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelSet, float]] = {}
+        self._callbacks: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+        self._runner: Optional[web.AppRunner] = None
+
+    @staticmethod
+    def _label_set(labels: Dict[str, object]) -> LabelSet:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        histograms = self._histograms.setdefault(name, {})
+        label_set = self._label_set(labels)
+
+        histogram = histograms.get(label_set)
+        if histogram is None:
+            histogram = histograms[label_set] = Histogram()
+        histogram.observe(value)
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        counters = self._counters.setdefault(name, {})
+        label_set = self._label_set(labels)
+        counters[label_set] = counters.get(label_set, 0) + value
+
+    def register(
+        self, name: str, callback: Callable[[], float], metric_type: str = "gauge"
+    ) -> None:
+        """Register a metric whose value is read from a callback when scraped."""
+        self._callbacks[name] = (metric_type, callback)
+
+    @contextlib.contextmanager
+    def time(self, name: str, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        for name, histograms in sorted(self._histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for label_set, histogram in histograms.items():
+                cumulative_count = 0
+                for bucket, bucket_count in zip(
+                    histogram.buckets, histogram.bucket_counts
+                ):
+                    cumulative_count += bucket_count
+                    bucket_labels = _format_labels(
+                        label_set + (("le", _format_value(bucket)),)
+                    )
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative_count}")
+
+                inf_labels = _format_labels(label_set + (("le", "+Inf"),))
+                lines.append(f"{name}_bucket{inf_labels} {histogram.count}")
+                lines.append(
+                    f"{name}_sum{_format_labels(label_set)} {_format_value(histogram.sum)}"
+                )
+                lines.append(
+                    f"{name}_count{_format_labels(label_set)} {histogram.count}"
+                )
+
+        for name, counters in sorted(self._counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            for label_set, value in counters.items():
+                lines.append(
+                    f"{name}{_format_labels(label_set)} {_format_value(value)}"
+                )
+
+        for name, (metric_type, callback) in sorted(self._callbacks.items()):
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name} {_format_value(callback())}")
+
+        return "\n".join(lines) + "\n"
+
+    """ HTTP endpoint. """
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.render(), content_type="text/plain", charset="utf-8"
+        )
+
+    async def start(self, host: str, port: int) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    """The nearest-rank percentile of sorted values."""
+    index = max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def interaction_latency(interaction: discord.Interaction) -> float:
+    """The time elapsed since an interaction was created, what counts for its ack."""
+    return (discord.utils.utcnow() - interaction.created_at).total_seconds()
+
+
+def timed_callback(func):
+    """Time a persistent view item callback, labelled with the item's custom ID."""
+
+    @functools.wraps(func)
+    async def wrapper(self, interaction: discord.Interaction, item: discord.ui.Item):
+        try:
+            return await func(self, interaction, item)
+        finally:
+            interaction.client.metrics.observe(
+                "discord_view_callback_latency_seconds",
+                interaction_latency(interaction),
+                custom_id=item.custom_id,
+            )
+
+    return wrapper
+
+
+def timed_method(name: str):
+    """Time a method of an object holding the client, labelled with its name."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            with self.client.metrics.time(name, method=func.__name__):
+                return await func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,116 @@
+import abc
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import discord
+
+# Fetches the page after a cursor, the number of the page is given too.
+FetchPage = Callable[[Optional[Any], int], Awaitable[List[Any]]]
+
+
+class PageCache:
+    """Pages fetched recently by key, each kept until it expires."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._pages: Dict[Hashable, Tuple[float, List[Any]]] = {}
+
+    async def fetch(
+        self,
+        key: Hashable,
+        fetch_page: Callable[[], Awaitable[List[Any]]],
+        cache: bool = True,
+    ) -> List[Any]:
+        """Return the cached page, or fetch it and cache it if asked."""
+        now = time.monotonic()
+
+        cached = self._pages.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        entries = await fetch_page()
+
+        if cache:
+            self._pages = {
+                key: value for key, value in self._pages.items() if value[0] > now
+            }
+            self._pages[key] = (now + self.ttl, entries)
+
+        return entries
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> None:
+        self._pages = {
+            key: value for key, value in self._pages.items() if not predicate(key)
+        }
+
+
+class PaginatedView(discord.ui.View, metaclass=abc.ABCMeta):
+    """Pages of entries fetched by keyset, only the user who asked can change them.
+
+    The cursor of a page is the cursor of the last entry of the page before it.
+    """
+
+    def __init__(
+        self,
+        author_id: int,
+        entries: List[Any],
+        page_size: int,
+        fetch_page: FetchPage,
+        get_cursor: Callable[[Any], Any],
+    ):
+        super().__init__(timeout=180)
+        self.author_id = author_id
+        self.page_size = page_size
+        self.fetch_page = fetch_page
+        self.get_cursor = get_cursor
+
+        self.cursors: List[Optional[Any]] = [None]
+        self.page = 0
+        self.entries = entries
+
+        self._update_buttons()
+
+    def _update_buttons(self) -> None:
+        self.previous.disabled = self.page == 0
+        self.next.disabled = len(self.entries) < self.page_size
+
+    @abc.abstractmethod
+    def build_embed(self) -> discord.Embed:
+        """The embed of the current page."""
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message(
+                "Only the user who used the command can change the page.",
+                ephemeral=True,
+            )
+            return False
+
+        return True
+
+    async def _show_page(self, interaction: discord.Interaction, page: int) -> None:
+        if page == len(self.cursors):
+            self.cursors.append(self.get_cursor(self.entries[-1]))
+
+        entries = await self.fetch_page(self.cursors[page], page)
+        if len(entries) == 0:
+            self.next.disabled = True
+            return await interaction.response.edit_message(view=self)
+
+        self.page = page
+        self.entries = entries
+        self._update_buttons()
+
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.blurple)
+    async def previous(
+        self, interaction: discord.Interaction, button: discord.ui.Button
+    ) -> None:
+        await self._show_page(interaction, self.page - 1)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.blurple)
+    async def next(
+        self, interaction: discord.Interaction, button: discord.ui.Button
+    ) -> None:
+        await self._show_page(interaction, self.page + 1)
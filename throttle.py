@@ -0,0 +1,139 @@
+import functools
+import time
+from typing import Dict, Hashable, NamedTuple, Optional
+
+import discord
+from discord import app_commands
+
+
+class TokenBuckets:
+    """Token buckets by key, each stored as the time it is full again.
+
+    A bucket holds `rate` tokens and gets one back every `per / rate` seconds. The
+    buckets which are full again are the same as new ones, so they are evicted.
+    """
+
+    EVICTION_INTERVAL = 60
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self.refill_time = per / rate
+
+        self._full_at: Dict[Hashable, float] = {}
+        self._evicted_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._full_at)
+
+    def retry_after(self, key: Hashable, now: float) -> float:
+        """How long to wait for a token, 0 if one is available."""
+        full_at = max(self._full_at.get(key, now), now)
+        return max(0.0, full_at + self.refill_time - now - self.per)
+
+    def take(self, key: Hashable, now: float) -> None:
+        full_at = max(self._full_at.get(key, now), now)
+        self._full_at[key] = full_at + self.refill_time
+
+        if now - self._evicted_at > self.EVICTION_INTERVAL:
+            self._full_at = {
+                key: full_at for key, full_at in self._full_at.items() if full_at > now
+            }
+            self._evicted_at = now
+
+
+class Rejection(NamedTuple):
+    scope: str
+    retry_after: float
+
+    @property
+    def message(self) -> str:
+        if self.scope == "global":
+            return (
+                f"Too many people are doing this right now, please try again in "
+                f"{self.retry_after:.1f}s."
+            )
+
+        return f"You are doing this too often, please try again in {self.retry_after:.1f}s."
+
+
+class Throttled(app_commands.CommandOnCooldown):
+    """A throttled application command, with the bucket which rejected it."""
+
+    def __init__(self, throttle: "Throttle", rejection: Rejection):
+        super().__init__(
+            app_commands.Cooldown(
+                throttle.user_buckets.rate, throttle.user_buckets.per
+            ),
+            rejection.retry_after,
+        )
+        self.rejection = rejection
+
+
+class Throttle:
+    """Limits how often something is used, by each user and by everyone at once."""
+
+    def __init__(
+        self, name: str, rate: int, per: float, global_rate: int, global_per: float
+    ):
+        self.name = name
+        self.user_buckets = TokenBuckets(rate, per)
+        self.global_bucket = TokenBuckets(global_rate, global_per)
+
+    def hit(self, user_id: int) -> Optional[Rejection]:
+        """Take a token for a user, unless their bucket or the global one is empty."""
+        now = time.monotonic()
+
+        retry_after = self.user_buckets.retry_after(user_id, now)
+        if retry_after > 0:
+            return Rejection("user", retry_after)
+
+        retry_after = self.global_bucket.retry_after(None, now)
+        if retry_after > 0:
+            return Rejection("global", retry_after)
+
+        self.user_buckets.take(user_id, now)
+        self.global_bucket.take(None, now)
+        return None
+
+
+def _reject(
+    interaction: discord.Interaction, throttle: Throttle, rejection: Rejection
+) -> None:
+    interaction.client.metrics.increment(
+        "throttle_rejections_total", throttle=throttle.name, scope=rejection.scope
+    )
+
+
+def throttled_command(throttle: Throttle):
+    """Throttle an application command, the rejected uses fail with Throttled."""
+
+    async def predicate(interaction: discord.Interaction) -> bool:
+        rejection = throttle.hit(interaction.user.id)
+        if rejection is None:
+            return True
+
+        _reject(interaction, throttle, rejection)
+        raise Throttled(throttle, rejection)
+
+    return app_commands.check(predicate)
+
+
+def throttled_callback(throttle: Throttle):
+    """Throttle a persistent view item callback, the rejected uses are answered."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(
+            self, interaction: discord.Interaction, item: discord.ui.Item
+        ):
+            rejection = throttle.hit(interaction.user.id)
+            if rejection is None:
+                return await func(self, interaction, item)
+
+            _reject(interaction, throttle, rejection)
+            await interaction.response.send_message(rejection.message, ephemeral=True)
+
+        return wrapper
+
+    return decorator